@@ -3,25 +3,543 @@
 Run the first loudnorm pass and save its JSON metrics.
 
 Usage:
-    analyse_loudness.py --logfile LOG --in-file IN --target-i -16 --target-tp -1.5 --out-json METRICS.json
+    analyse_loudness.py --logfile LOG --in-file IN --target-i -16 --target-tp -1.5 --out-json METRICS.json [--pcm-out AUDIO.w64] [--backend ffmpeg|numpy] [--jobs N] [--no-cache]
+
+With ``--pcm-out`` the high-passed audio is also written, during the same
+decode, as 32-bit float PCM so ``normalize_audio.py --pcm-in`` can apply the
+gain without decoding the source a second time.
+
+``--backend numpy`` measures in-process (ITU-R BS.1770 / EBU R128) from PCM
+streamed out of ffmpeg instead of parsing loudnorm's log; the JSON keys are
+the same. With ``--jobs N`` it splits the file into time chunks measured by N
+processes and gates the merged block energies, so the result matches a
+single pass.
+
+Input measurements do not depend on the target, so they are cached per file
+(see ``utils.MetadataCache``); re-targeting a file skips the analysis unless
+loudnorm would have to fall back to dynamic mode. ``--no-cache`` re-measures.
 """
 from __future__ import annotations
 import argparse
 import json
-import re
+import math
 import shlex
 import subprocess
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Any, cast
-from utils import setup_logging
+from typing import Any, NamedTuple
+from utils import (
+    MetadataCache,
+    StageLogger,
+    probe_media,
+    run_streamed,
+    setup_logging,
+)
+
+try:
+    import numpy as np
+except ImportError:  # only --backend numpy needs it; checked in _measure_numpy
+    np = None
+
+R128_RATE = 48000  # the K-weighting coefficients below are for 48 kHz
+SEGMENT = R128_RATE // 10  # 100 ms: the hop of both block lengths
+CHUNK_FRAMES = 1 << 16  # frames read from ffmpeg per step
+# BS.1770-4 K-weighting: pre-filter high shelf, then the RLB high-pass.
+K_SHELF = (
+    (1.53512485958697, -2.69169618940638, 1.19839281085285),
+    (1.0, -1.69065929318241, 0.73248077421585),
+)
+K_RLB = ((1.0, -2.0, 1.0), (1.0, -1.99004745483398, 0.99007225036621))
+K_IR_TAPS = 1 << 14  # the filter has rung down by > 200 dB after this
+OVERSAMPLE = 4  # true-peak interpolation factor
+ABS_GATE = -70.0
+PREROLL_SEGMENTS = 10  # 1 s of settling audio decoded ahead of each chunk
+MIN_CHUNK_SEGMENTS = 600  # don't split below one minute per process
+MAX_JSON_LINES = 64  # loudnorm prints ~12; anything longer is not its block
+TAIL_LINES = 40  # decoder stderr kept for the error message
+HIGHPASS = "highpass=f=120"
+TARGET_LRA = 11.0
+INPUT_KEYS = ("input_i", "input_tp", "input_lra", "input_thresh")
+
+loudness_cache = MetadataCache("loudness")
+
+
+class Analysis(NamedTuple):
+    """One file to measure, and the target the metrics are for."""
+
+    in_file: str
+    target_i: float = -16.0
+    target_tp: float = -1.5
+    pcm_out: str | None = None
+    backend: str = "ffmpeg"
+    jobs: int = 1
+
+
+class LoudnormJSON:
+    """
+    Line-fed state machine that lifts loudnorm's ``{ … }`` block out of
+    FFmpeg's log.
+
+    ``feed`` returns the lines that are *not* part of the block so the
+    caller can pass them on; only the block itself (a dozen lines) is ever
+    buffered.
+    """
+
+    def __init__(self) -> None:
+        self.block: list[str] | None = None
+        self.result: dict[str, Any] | None = None
+
+    def feed(self, line: str) -> list[str]:
+        text = line.strip()
+        if self.block is None:
+            if not text.startswith("{"):
+                return [line]
+            self.block = []
+        self.block.append(line)
+        if text.endswith("}"):
+            block, self.block = self.block, None
+            try:
+                data = json.loads("\n".join(block))
+            except ValueError:
+                return block
+            if not isinstance(data, dict) or "input_i" not in data:
+                return block
+            self.result = data
+        elif len(self.block) > MAX_JSON_LINES:
+            block, self.block = self.block, None
+            return block
+        return []
 
 
 def extract_json(stderr: str) -> dict[str, Any]:
     """Pull the { … } block printed by FFmpeg and load it."""
-    m = re.search(r"\{\s*\"input_i\".*\}", stderr, re.S)
-    if not m:
+    parser = LoudnormJSON()
+    for line in stderr.splitlines():
+        parser.feed(line)
+    if parser.result is None:
+        raise RuntimeError("Could not find loudnorm JSON in FFmpeg output")
+    return parser.result
+
+
+def _k_weighting_ir() -> Any:
+    """Impulse response of the two K-weighting biquads, truncated."""
+    n = K_IR_TAPS * 4
+    z = np.exp(-2j * np.pi * np.arange(n // 2 + 1) / n)  # z^-1 on the unit circle
+    h = np.ones_like(z)
+    for b, a in (K_SHELF, K_RLB):
+        h *= (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return np.fft.irfft(h, n)[:K_IR_TAPS]
+
+
+def _oversample_phases() -> Any:
+    """
+    Kaiser-windowed sinc interpolator split into its OVERSAMPLE polyphase
+    branches, shape ``(OVERSAMPLE, taps)``.
+    """
+    taps = 12 * OVERSAMPLE + 1
+    n = np.arange(taps) - (taps - 1) / 2
+    h = np.sinc(n / OVERSAMPLE) * np.kaiser(taps, 8.0)
+    h = np.concatenate([h, np.zeros(-taps % OVERSAMPLE)])
+    return h.reshape(-1, OVERSAMPLE).T
+
+
+def _channel_weights(channels: int) -> Any:
+    """BS.1770 channel gains: surrounds +1.5 dB, LFE ignored (5.1 order)."""
+    if channels == 6:
+        return np.array([1.0, 1.0, 1.0, 0.0, 1.41, 1.41])
+    return np.ones(channels)
+
+
+class _FIRStream:
+    """Overlap-add FFT convolution of a (frames, channels) stream."""
+
+    def __init__(self, h: Any) -> None:
+        self.h = h
+        self.tail: Any = None
+        self._spectra: dict[int, Any] = {}
+
+    def feed(self, x: Any) -> Any:
+        n, m = len(x), len(self.h)
+        size = 1 << (n + m - 2).bit_length()
+        if size not in self._spectra:
+            self._spectra[size] = np.fft.rfft(self.h, size)[:, None]
+        spec = np.fft.rfft(x, size, axis=0) * self._spectra[size]
+        y = np.fft.irfft(spec, size, axis=0)[: n + m - 1]
+        if self.tail is not None:
+            y[: m - 1] += self.tail
+        self.tail = y[n:]
+        return y[:n]
+
+
+class R128Meter:
+    """
+    Streaming loudness meter.
+
+    ``feed`` takes float PCM at :data:`R128_RATE` and keeps only the
+    channel-weighted K-filtered energy of each 100 ms segment plus the true
+    peak, so memory grows by one float per 100 ms of audio.
+    """
+
+    def __init__(self, channels: int, skip: int = 0) -> None:
+        self.skip = skip  # leading frames left out of the peak
+        self.weights = _channel_weights(channels)
+        self.kweight = _FIRStream(_k_weighting_ir())
+        self.phases = _oversample_phases()
+        self.history = np.zeros((self.phases.shape[1] - 1, channels))
+        self.pending = np.zeros(0)
+        self.segments: list[Any] = []
+        self.peak = 0.0
+
+    def feed(self, x: Any) -> None:
+        # Interpolated samples, one row per polyphase branch; the filter is
+        # short, so direct convolution beats an FFT here.
+        n, taps = len(x), self.phases.shape[1]
+        xx = np.concatenate([self.history, x])
+        self.history = xx[n:]
+        up = np.zeros((OVERSAMPLE, n, x.shape[1]))
+        for k in range(taps):
+            up += self.phases[:, k, None, None] * xx[taps - 1 - k : taps - 1 - k + n]
+        lead = min(self.skip, n)
+        self.skip -= lead
+        self.peak = max(
+            self.peak,
+            float(np.abs(x[lead:]).max(initial=0.0)),
+            float(np.abs(up[:, lead:]).max(initial=0.0)),
+        )
+        power = np.concatenate(
+            [self.pending, (self.kweight.feed(x) ** 2) @ self.weights]
+        )
+        whole = len(power) // SEGMENT * SEGMENT
+        self.segments.append(power[:whole].reshape(-1, SEGMENT).sum(axis=1))
+        self.pending = power[whole:]
+
+    def energies(self) -> Any:
+        return np.concatenate(self.segments) if self.segments else np.zeros(0)
+
+
+def r128_metrics(energies: Any, peak: float) -> dict[str, str]:
+    """
+    Gate 100 ms segment energies into loudnorm-style metrics.
+
+    Integrated loudness uses 400 ms blocks (75 % overlap) with the -70 LUFS
+    absolute and -10 LU relative gates; LRA uses 3 s blocks gated at -20 LU
+    and takes the 10th–95th percentile spread.
+    """
+    csum = np.concatenate([[0.0], np.cumsum(energies)])
+
+    def blocks(n: int) -> Any:
+        return (csum[n:] - csum[:-n]) / (n * SEGMENT)
+
+    def lufs(z: Any) -> Any:
+        with np.errstate(divide="ignore"):
+            return -0.691 + 10 * np.log10(z)
+
+    momentary = blocks(4)
+    momentary = momentary[lufs(momentary) > ABS_GATE]
+    integrated = thresh = -math.inf
+    if len(momentary):
+        thresh = float(lufs(momentary.mean())) - 10
+        gated = momentary[lufs(momentary) > thresh]
+        integrated = float(lufs(gated.mean()))
+
+    short = blocks(30)
+    short = short[lufs(short) > ABS_GATE]
+    lra = 0.0
+    if len(short):
+        levels = lufs(short)
+        levels = levels[levels > float(lufs(short.mean())) - 20]
+        lo, hi = np.percentile(levels, [10, 95])
+        lra = float(hi - lo)
+
+    tp = 20 * math.log10(peak) if peak > 0 else -math.inf
+    return {
+        "input_i": f"{integrated:.2f}",
+        "input_tp": f"{tp:.2f}",
+        "input_lra": f"{lra:.2f}",
+        "input_thresh": f"{thresh:.2f}",
+        "target_offset": "0.00",
+    }
+
+
+def _measure_loudnorm(job: Analysis, logger: StageLogger) -> dict[str, Any]:
+    loudnorm = (
+        f"loudnorm=I={job.target_i}:TP={job.target_tp}:LRA={TARGET_LRA:g}:"
+        "print_format=json"
+    )
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-loglevel", "verbose", "-y"]
+    cmd += ["-i", job.in_file]
+    if job.pcm_out:
+        # One decode feeds both the measurement and the intermediate.
+        cmd += [
+            "-filter_complex",
+            f"[0:a]{HIGHPASS},asplit=2[m][p];[m]{loudnorm}[mo]",
+            "-map",
+            "[mo]",
+            "-f",
+            "null",
+            "-",
+            "-map",
+            "[p]",
+            "-c:a",
+            "pcm_f32le",
+            "-f",
+            "w64",
+            job.pcm_out,
+        ]
+    else:
+        cmd += ["-af", f"{HIGHPASS},{loudnorm}", "-f", "null", "-"]
+    logger.info("Command: %s", " ".join(shlex.quote(p) for p in cmd))
+    parser = LoudnormJSON()
+
+    def on_line(line: str) -> None:
+        for other in parser.feed(line):
+            if other.strip():
+                logger.info("ffmpeg: %s", other)
+
+    returncode = run_streamed(cmd, on_line)
+    if returncode != 0:
+        logger.error("FFmpeg exited with status %d", returncode)
+        raise SystemExit(returncode)
+    if parser.result is None:
         raise RuntimeError("Could not find loudnorm JSON in FFmpeg output")
-    return cast(dict[str, Any], json.loads(m.group(0)))
+    return parser.result
+
+
+def _decode_cmd(
+    in_file: str,
+    channels: int,
+    pcm_out: str | None = None,
+    span: tuple[float, float] | None = None,
+) -> list[str]:
+    """ffmpeg command streaming high-passed f32le at R128_RATE to stdout."""
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"]
+    if span is not None:
+        cmd += ["-ss", f"{span[0]:.3f}", "-t", f"{span[1]:.3f}"]
+    split = ",asplit=2[m][p]" if pcm_out else "[m]"
+    cmd += ["-i", in_file]
+    cmd += ["-filter_complex", f"[0:a]{HIGHPASS}{split}", "-map", "[m]"]
+    cmd += ["-ac", str(channels), "-ar", str(R128_RATE), "-f", "f32le", "pipe:1"]
+    if pcm_out:
+        cmd += ["-map", "[p]", "-c:a", "pcm_f32le", "-f", "w64", pcm_out]
+    return cmd
+
+
+def _run_meter(cmd: list[str], channels: int, skip: int = 0) -> R128Meter:
+    """Feed ffmpeg's stdout through a meter; CalledProcessError on failure."""
+    meter = R128Meter(channels, skip)
+    frame = 4 * channels
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert proc.stdout is not None and proc.stderr is not None
+    stderr = proc.stderr
+    tail: deque[str] = deque(maxlen=TAIL_LINES)
+
+    def drain() -> None:
+        # a damaged file can log an error per frame; a full stderr pipe
+        # would block ffmpeg while we block on its stdout
+        for line in stderr:
+            tail.append(line.decode(errors="replace").rstrip())
+
+    reader = threading.Thread(target=drain, daemon=True)
+    reader.start()
+    try:
+        while chunk := proc.stdout.read(CHUNK_FRAMES * frame):
+            pcm = np.frombuffer(chunk[: len(chunk) // frame * frame], dtype="<f4")
+            meter.feed(pcm.reshape(-1, channels).astype(np.float64))
+        rc = proc.wait()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        reader.join()
+    if rc != 0:
+        raise subprocess.CalledProcessError(rc, cmd, stderr="\n".join(tail))
+    return meter
+
+
+def _measure_chunk(
+    in_file: str, channels: int, first: int, count: int
+) -> tuple[Any, float]:
+    """
+    Segment energies and peak for segments ``first … first+count``.
+
+    Decoding starts up to PREROLL_SEGMENTS earlier so the high-pass and
+    K-weighting filters have settled; that pre-roll is measured and dropped.
+    """
+    pre = min(PREROLL_SEGMENTS, first)
+    span = ((first - pre) / 10, (pre + count) / 10)
+    meter = _run_meter(
+        _decode_cmd(in_file, channels, span=span), channels, pre * SEGMENT
+    )
+    return meter.energies()[pre : pre + count], meter.peak
+
+
+def _measure_numpy(job: Analysis, logger: StageLogger) -> dict[str, Any]:
+    if np is None:
+        logger.error("--backend numpy requires NumPy (pip install numpy)")
+        raise SystemExit(1)
+
+    try:
+        info = probe_media(Path(job.in_file))
+    except (OSError, subprocess.CalledProcessError, ValueError, KeyError) as exc:
+        logger.error(f"Cannot probe {job.in_file}: {exc}")
+        raise SystemExit(1)
+    audio = [st for st in info["streams"] if st["type"] == "audio" and st["channels"]]
+    if not audio:
+        logger.error(f"No audio stream in {job.in_file}")
+        raise SystemExit(1)
+    channels = int(audio[0]["channels"])
+
+    segments = math.ceil(info["duration"] * 10)
+    chunks = min(job.jobs, math.ceil(segments / MIN_CHUNK_SEGMENTS))
+    try:
+        if chunks <= 1:
+            cmd = _decode_cmd(job.in_file, channels, job.pcm_out)
+            logger.info("Command: %s", " ".join(shlex.quote(p) for p in cmd))
+            meter = _run_meter(cmd, channels)
+            return r128_metrics(meter.energies(), meter.peak)
+
+        # Time chunks on 100 ms boundaries; their segment energies join into
+        # exactly the sequence one continuous pass would produce.
+        per = math.ceil(segments / chunks)
+        firsts = list(range(0, segments, per))
+        logger.info(
+            "Measuring %d chunks of %.1fs across %d processes",
+            len(firsts),
+            per / 10,
+            job.jobs,
+        )
+        with ProcessPoolExecutor(max_workers=job.jobs) as pool:
+            parts = list(
+                pool.map(
+                    _measure_chunk,
+                    [job.in_file] * len(firsts),
+                    [channels] * len(firsts),
+                    firsts,
+                    [min(per, segments - f) for f in firsts],
+                )
+            )
+    except subprocess.CalledProcessError as exc:
+        logger.error(exc.stderr.strip())
+        raise SystemExit(exc.returncode)
+    energies = np.concatenate([e for e, _ in parts])
+    return r128_metrics(energies, max(p for _, p in parts))
+
+
+def _cache_slot(job: Analysis) -> tuple[str, str]:
+    """(measurement variant, target) keys inside a file's cache record."""
+    return f"{job.backend}:{HIGHPASS}", f"{job.target_i:g}/{job.target_tp:g}"
+
+
+def _cached_metrics(job: Analysis) -> dict[str, Any] | None:
+    """
+    Cached measurements of ``job.in_file`` completed for the current target.
+
+    ``target_offset`` is the only target-dependent value.  It is reused when
+    this exact target was measured before; otherwise it only matters if
+    loudnorm falls back to dynamic mode, because in linear mode pass 2
+    derives the gain from ``input_i`` and ignores the offset.  NumPy
+    measurements always carry a zero offset.
+    """
+    variant, target = _cache_slot(job)
+    m = (loudness_cache.get(Path(job.in_file)) or {}).get(variant)
+    if not m or any(k not in m for k in INPUT_KEYS):
+        return None
+    offsets = m.get("offsets", {})
+    if target in offsets:
+        offset = offsets[target]
+    elif job.backend == "numpy" or _linear_feasible(m, job):
+        offset = "0.00"
+    else:
+        return None
+    return {**{k: m[k] for k in INPUT_KEYS}, "target_offset": offset}
+
+
+def _linear_feasible(m: dict[str, Any], job: Analysis) -> bool:
+    """Whether loudnorm can reach the target with a plain gain."""
+    try:
+        gain = job.target_i - float(m["input_i"])
+        return bool(
+            float(m["input_tp"]) + gain <= job.target_tp
+            and float(m["input_lra"]) <= TARGET_LRA
+        )
+    except (TypeError, ValueError):
+        return False
+
+
+def _remember(job: Analysis, metrics: dict[str, Any]) -> None:
+    variant, target = _cache_slot(job)
+    if any(k not in metrics for k in INPUT_KEYS):
+        return
+    old = (loudness_cache.get(Path(job.in_file)) or {}).get(variant) or {}
+    inputs = {k: metrics[k] for k in INPUT_KEYS}
+    same = all(old.get(k) == v for k, v in inputs.items())
+    offsets = {**(old.get("offsets", {}) if same else {})}
+    offsets[target] = metrics.get("target_offset")
+    loudness_cache.put(Path(job.in_file), {variant: {**inputs, "offsets": offsets}})
+
+
+def _write_pcm(in_file: str, pcm_out: str, logger: StageLogger) -> None:
+    """Produce the ``--pcm-out`` intermediate on its own (cache hits)."""
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-loglevel", "error", "-y"]
+    cmd += ["-i", in_file, "-filter_complex", f"[0:a]{HIGHPASS}[p]"]
+    cmd += ["-map", "[p]", "-c:a", "pcm_f32le", "-f", "w64", pcm_out]
+    logger.info("Command: %s", " ".join(shlex.quote(p) for p in cmd))
+    returncode = run_streamed(cmd, lambda line: logger.info("ffmpeg: %s", line))
+    if returncode != 0:
+        logger.error("FFmpeg exited with status %d", returncode)
+        raise SystemExit(returncode)
+
+
+def run(
+    in_file: str | Path,
+    out_json: str | Path | None = None,
+    *,
+    logger: StageLogger,
+    target_i: float = -16.0,
+    target_tp: float = -1.5,
+    pcm_out: str | Path | None = None,
+    backend: str = "ffmpeg",
+    jobs: int = 1,
+    use_cache: bool = True,
+) -> dict[str, Any]:
+    """Measure ``in_file`` (or reuse cached results) and return the metrics."""
+    job = Analysis(
+        str(in_file),
+        target_i,
+        target_tp,
+        str(pcm_out) if pcm_out else None,
+        backend,
+        jobs,
+    )
+    if jobs < 1 or (jobs > 1 and (backend != "numpy" or pcm_out)):
+        raise ValueError("jobs > 1 needs the numpy backend and no pcm_out")
+
+    logger.info("PASS 1 analysing -> target %s LUFS / %s dBTP" % (target_i, target_tp))
+    cached = _cached_metrics(job) if use_cache else None
+    if cached is not None:
+        logger.info("Using cached %s measurements of %s", backend, in_file)
+        metrics = cached
+        if pcm_out:
+            _write_pcm(job.in_file, str(pcm_out), logger)
+    else:
+        if backend == "numpy":
+            metrics = _measure_numpy(job, logger)
+        else:
+            metrics = _measure_loudnorm(job, logger)
+        _remember(job, metrics)
+
+    if out_json is not None:
+        try:
+            Path(out_json).write_text(json.dumps(metrics, indent=2))
+        except OSError as exc:  # pragma: no cover
+            logger.error(str(exc))
+            raise SystemExit(1)
+        logger.info(f"Metrics saved to {out_json}")
+    if pcm_out:
+        logger.info(f"PCM intermediate saved to {pcm_out}")
+    return metrics
 
 
 def main() -> None:
@@ -31,40 +549,28 @@ def main() -> None:
     ap.add_argument("--target-i", type=float, default=-16.0)
     ap.add_argument("--target-tp", type=float, default=-1.5)
     ap.add_argument("--out-json", required=True)
+    ap.add_argument("--pcm-out")
+    ap.add_argument("--backend", choices=("ffmpeg", "numpy"), default="ffmpeg")
+    ap.add_argument("--jobs", type=int, default=1)
+    ap.add_argument("--no-cache", action="store_true")
     ns = ap.parse_args()
+    if ns.jobs < 1:
+        ap.error("--jobs must be at least 1")
+    if ns.jobs > 1 and (ns.backend != "numpy" or ns.pcm_out):
+        ap.error("--jobs > 1 needs --backend numpy and no --pcm-out")
 
     logger = setup_logging(ns.logfile, "loudnorm-pass1")
-
-    logger.info(
-        "PASS 1 analysing -> target %s LUFS / %s dBTP" % (ns.target_i, ns.target_tp)
-    )
-    cmd = [
-        "ffmpeg",
-        "-hide_banner",
-        "-loglevel",
-        "verbose",
-        "-i",
+    run(
         ns.in_file,
-        "-af",
-        f"highpass=f=120,loudnorm=I={ns.target_i}:TP={ns.target_tp}:LRA=11:print_format=json",
-        "-f",
-        "null",
-        "-",
-    ]
-    logger.info("Command: %s", " ".join(shlex.quote(p) for p in cmd))
-    try:
-        proc = subprocess.run(cmd, stderr=subprocess.PIPE, text=True, check=True)
-    except subprocess.CalledProcessError as exc:  # pragma: no cover
-        logger.error(exc.stderr.strip())
-        raise SystemExit(exc.returncode)
-    metrics = extract_json(proc.stderr)
-
-    try:
-        Path(ns.out_json).write_text(json.dumps(metrics, indent=2))
-    except OSError as exc:  # pragma: no cover
-        logger.error(str(exc))
-        raise SystemExit(1)
-    logger.info(f"Metrics saved to {ns.out_json}")
+        ns.out_json,
+        logger=logger,
+        target_i=ns.target_i,
+        target_tp=ns.target_tp,
+        pcm_out=ns.pcm_out,
+        backend=ns.backend,
+        jobs=ns.jobs,
+        use_cache=not ns.no_cache,
+    )
 
 
 if __name__ == "__main__":
@@ -169,3 +169,331 @@ def test_s4_invalid_numeric_target() -> None:
         log.unlink(missing_ok=True)
         (workdir / "output" / "metrics.json").unlink(missing_ok=True)
         compose(compose_file, workdir, "down", "-v", check=False)
+
+
+def test_s5_pcm_out_single_decode(tmp_path: Path) -> None:
+    script = Path(__file__).resolve().parents[1] / "analyse_loudness.py"
+    fake_ffmpeg = tmp_path / "ffmpeg"
+    calls = tmp_path / "ffmpeg.calls"
+    fake_ffmpeg.write_text(
+        f"""#!/usr/bin/env python3
+import sys, pathlib
+with open({str(calls)!r}, "a") as fh:
+    fh.write(" ".join(sys.argv[1:]) + "\\n")
+pathlib.Path(sys.argv[-1]).write_bytes(b"pcm")
+print('{{"input_i":"-20","input_tp":"-1","input_lra":"1","input_thresh":"-30","target_offset":"0"}}', file=sys.stderr)
+"""
+    )
+    fake_ffmpeg.chmod(0o755)
+    log = tmp_path / "log.txt"
+    metrics = tmp_path / "metrics.json"
+    pcm = tmp_path / "audio.w64"
+    env = os.environ.copy()
+    env["PATH"] = f"{tmp_path}:{env['PATH']}"
+    env["PYTHONPATH"] = str(Path(__file__).resolve().parents[3])
+    proc = subprocess.run(
+        [
+            sys.executable,
+            str(script),
+            "--logfile",
+            str(log),
+            "--in-file",
+            "dummy.wav",
+            "--out-json",
+            str(metrics),
+            "--pcm-out",
+            str(pcm),
+        ],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False,
+    )
+    assert proc.returncode == 0, proc.stderr
+    lines = calls.read_text().splitlines()
+    assert len(lines) == 1
+    assert "asplit=2" in lines[0]
+    assert "pcm_f32le" in lines[0]
+    assert pcm.read_bytes() == b"pcm"
+    assert json.loads(metrics.read_text())["input_i"] == "-20"
+
+
+def test_s6_numpy_backend(tmp_path: Path) -> None:
+    pytest.importorskip("numpy")
+    script = Path(__file__).resolve().parents[1] / "analyse_loudness.py"
+    (tmp_path / "ffprobe").write_text(
+        '#!/bin/sh\necho \'{"format": {"duration": "5.0"}, '
+        '"streams": [{"codec_type": "audio", "codec_name": "pcm_s16le", "channels": 2}]}\'\n'
+    )
+    # A 997 Hz sine at -6 dBFS on both channels: -6.02 LUFS, -6.02 dBTP.
+    (tmp_path / "ffmpeg").write_text(
+        """#!/usr/bin/env python3
+import array, math, sys
+buf = array.array("f")
+for i in range(48000 * 5):
+    v = 0.5 * math.sin(2 * math.pi * 997 * i / 48000)
+    buf.extend((v, v))
+sys.stdout.buffer.write(buf.tobytes())
+"""
+    )
+    for exe in ("ffprobe", "ffmpeg"):
+        (tmp_path / exe).chmod(0o755)
+    src = tmp_path / "tone.wav"
+    src.write_bytes(b"x")
+    log = tmp_path / "log.txt"
+    metrics = tmp_path / "metrics.json"
+    env = os.environ.copy()
+    env["PATH"] = f"{tmp_path}:{env['PATH']}"
+    env["PYTHONPATH"] = str(Path(__file__).resolve().parents[3])
+    env["XDG_CACHE_HOME"] = str(tmp_path / "cache")
+    proc = subprocess.run(
+        [
+            sys.executable,
+            str(script),
+            "--logfile",
+            str(log),
+            "--in-file",
+            str(src),
+            "--out-json",
+            str(metrics),
+            "--backend",
+            "numpy",
+        ],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False,
+    )
+    assert proc.returncode == 0, proc.stderr
+    data = json.loads(metrics.read_text())
+    assert abs(float(data["input_i"]) + 6.02) < 0.1
+    assert abs(float(data["input_tp"]) + 6.02) < 0.1
+    assert float(data["input_lra"]) < 0.1
+    assert abs(float(data["input_thresh"]) + 16.02) < 0.1
+    assert data["target_offset"] == "0.00"
+    assert "-f f32le pipe:1" in log.read_text()
+
+
+def test_s7_numpy_chunk_parallel_matches_single_pass(tmp_path: Path) -> None:
+    pytest.importorskip("numpy")
+    script = Path(__file__).resolve().parents[1] / "analyse_loudness.py"
+    (tmp_path / "ffprobe").write_text(
+        '#!/bin/sh\necho \'{"format": {"duration": "150.0"}, '
+        '"streams": [{"codec_type": "audio", "codec_name": "pcm_s16le", "channels": 1}]}\'\n'
+    )
+    # Three loudness plateaus; honours -ss/-t so chunks see the same signal.
+    (tmp_path / "ffmpeg").write_text(
+        """#!/usr/bin/env python3
+import sys
+import numpy as np
+args = sys.argv[1:]
+ss = float(args[args.index("-ss") + 1]) if "-ss" in args else 0.0
+t = float(args[args.index("-t") + 1]) if "-t" in args else 150.0 - ss
+n = np.arange(round(ss * 48000), round(min(ss + t, 150.0) * 48000))
+amp = np.select([n < 50 * 48000, n < 100 * 48000], [0.5, 0.05], 0.3)
+pcm = amp * np.sin(2 * np.pi * 997 * n / 48000)
+sys.stdout.buffer.write(pcm.astype("<f4").tobytes())
+"""
+    )
+    for exe in ("ffprobe", "ffmpeg"):
+        (tmp_path / exe).chmod(0o755)
+    src = tmp_path / "talk.wav"
+    src.write_bytes(b"x")
+    env = os.environ.copy()
+    env["PATH"] = f"{tmp_path}:{env['PATH']}"
+    env["PYTHONPATH"] = str(Path(__file__).resolve().parents[3])
+    env["XDG_CACHE_HOME"] = str(tmp_path / "cache")
+
+    def measure(jobs: int) -> dict[str, str]:
+        out = tmp_path / f"metrics{jobs}.json"
+        proc = subprocess.run(
+            [
+                sys.executable,
+                str(script),
+                "--logfile",
+                str(tmp_path / f"log{jobs}.txt"),
+                "--in-file",
+                str(src),
+                "--out-json",
+                str(out),
+                "--backend",
+                "numpy",
+                "--jobs",
+                str(jobs),
+                "--no-cache",
+            ],
+            capture_output=True,
+            text=True,
+            env=env,
+            check=False,
+        )
+        assert proc.returncode == 0, proc.stderr
+        return dict(json.loads(out.read_text()))
+
+    single, chunked = measure(1), measure(3)
+    assert "Measuring 3 chunks" in (tmp_path / "log3.txt").read_text()
+    for key in ("input_i", "input_tp", "input_lra", "input_thresh"):
+        assert abs(float(single[key]) - float(chunked[key])) <= 0.01, key
+    assert float(single["input_lra"]) > 10
+
+
+def test_s10_numpy_backend_noisy_decoder(tmp_path: Path) -> None:
+    pytest.importorskip("numpy")
+    script = Path(__file__).resolve().parents[1] / "analyse_loudness.py"
+    (tmp_path / "ffprobe").write_text(
+        '#!/bin/sh\necho \'{"format": {"duration": "1.0"}, '
+        '"streams": [{"codec_type": "audio", "codec_name": "aac", "channels": 1}]}\'\n'
+    )
+    # A damaged file: far more stderr than a pipe holds, before any PCM.
+    (tmp_path / "ffmpeg").write_text(
+        """#!/usr/bin/env python3
+import sys
+for i in range(5000):
+    print(f"[aac @ 0x1] error while decoding frame {i}", file=sys.stderr)
+sys.stdout.buffer.write(bytes(4 * 48000))
+sys.exit(1)
+"""
+    )
+    for exe in ("ffprobe", "ffmpeg"):
+        (tmp_path / exe).chmod(0o755)
+    src = tmp_path / "damaged.m4a"
+    src.write_bytes(b"x")
+    log = tmp_path / "log.txt"
+    env = os.environ.copy()
+    env["PATH"] = f"{tmp_path}:{env['PATH']}"
+    env["PYTHONPATH"] = str(Path(__file__).resolve().parents[3])
+    env["XDG_CACHE_HOME"] = str(tmp_path / "cache")
+    proc = subprocess.run(
+        [
+            sys.executable,
+            str(script),
+            "--logfile",
+            str(log),
+            "--in-file",
+            str(src),
+            "--out-json",
+            str(tmp_path / "metrics.json"),
+            "--backend",
+            "numpy",
+        ],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False,
+        timeout=60,
+    )
+    assert proc.returncode == 1
+    text = log.read_text()
+    assert "error while decoding frame 4999" in text
+    assert "error while decoding frame 0\n" not in text  # only the tail
+
+
+def test_s8_streamed_loudnorm_log(tmp_path: Path) -> None:
+    script = Path(__file__).resolve().parents[1] / "analyse_loudness.py"
+    (tmp_path / "ffmpeg").write_text(
+        """#!/usr/bin/env python3
+import sys
+for i in range(2000):
+    print(f"[aac @ 0x1] frame {i} decoded", file=sys.stderr)
+print("{ chapter metadata }", file=sys.stderr)
+print("[Parsed_loudnorm_1 @ 0x2] ", file=sys.stderr)
+print('''{
+\t"input_i" : "-23.40",
+\t"input_tp" : "-4.10",
+\t"input_lra" : "6.20",
+\t"input_thresh" : "-33.80",
+\t"target_offset" : "0.30"
+}''', file=sys.stderr)
+print("[out#0 @ 0x3] done", file=sys.stderr)
+"""
+    )
+    (tmp_path / "ffmpeg").chmod(0o755)
+    log = tmp_path / "log.txt"
+    metrics = tmp_path / "metrics.json"
+    env = os.environ.copy()
+    env["PATH"] = f"{tmp_path}:{env['PATH']}"
+    env["PYTHONPATH"] = str(Path(__file__).resolve().parents[3])
+    proc = subprocess.run(
+        [
+            sys.executable,
+            str(script),
+            "--logfile",
+            str(log),
+            "--in-file",
+            "dummy.wav",
+            "--out-json",
+            str(metrics),
+        ],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False,
+    )
+    assert proc.returncode == 0, proc.stderr
+    assert json.loads(metrics.read_text())["input_tp"] == "-4.10"
+    text = log.read_text()
+    assert "ffmpeg: [aac @ 0x1] frame 1999 decoded" in text
+    assert "ffmpeg: { chapter metadata }" in text
+    assert "ffmpeg: [out#0 @ 0x3] done" in text
+    assert '"input_i"' not in text
+
+
+def test_s9_retarget_uses_cache(tmp_path: Path) -> None:
+    script = Path(__file__).resolve().parents[1] / "analyse_loudness.py"
+    calls = tmp_path / "ffmpeg.calls"
+    (tmp_path / "ffmpeg").write_text(
+        f"""#!/bin/sh
+echo call >> {calls}
+echo '{{"input_i":"-20.00","input_tp":"-8.00","input_lra":"5.00","input_thresh":"-30.00","target_offset":"0.40"}}' >&2
+"""
+    )
+    (tmp_path / "ffmpeg").chmod(0o755)
+    src = tmp_path / "episode.wav"
+    src.write_bytes(b"x")
+    env = os.environ.copy()
+    env["PATH"] = f"{tmp_path}:{env['PATH']}"
+    env["PYTHONPATH"] = str(Path(__file__).resolve().parents[3])
+    env["XDG_CACHE_HOME"] = str(tmp_path / "cache")
+
+    def analyse(target_i: str) -> dict[str, str]:
+        out = tmp_path / f"metrics{target_i}.json"
+        proc = subprocess.run(
+            [
+                sys.executable,
+                str(script),
+                "--logfile",
+                str(tmp_path / "log.txt"),
+                "--in-file",
+                str(src),
+                "--out-json",
+                str(out),
+                "--target-i",
+                target_i,
+            ],
+            capture_output=True,
+            text=True,
+            env=env,
+            check=False,
+        )
+        assert proc.returncode == 0, proc.stderr
+        return dict(json.loads(out.read_text()))
+
+    def n_calls() -> int:
+        return len(calls.read_text().splitlines())
+
+    assert analyse("-16")["target_offset"] == "0.40"
+    assert n_calls() == 1
+    # Same target: exact hit.  -23 and -14 stay linear: no re-measure.
+    assert analyse("-16")["target_offset"] == "0.40"
+    retarget = analyse("-23")
+    analyse("-14")
+    assert n_calls() == 1
+    assert retarget["input_i"] == "-20.00"
+    assert retarget["target_offset"] == "0.00"
+    # -10 LUFS would push the peak over -1.5 dBTP: loudnorm goes dynamic,
+    # so its offset must be measured.
+    analyse("-10")
+    assert n_calls() == 2
+    src.write_bytes(b"edited")
+    analyse("-16")
+    assert n_calls() == 3
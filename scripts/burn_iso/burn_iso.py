@@ -4,18 +4,46 @@
 The implementation is intentionally minimal so automated tests can run without
 touching hardware. Use ``--dry-run`` during CI runs. When executed normally the
 command produced by ``growisofs`` will run on the host system.
+
+``--iso-path -`` (or :func:`run_stream`) burns an image arriving on a pipe,
+e.g. straight from ``genisoimage``, without an intermediate ``.iso`` file.
+The data passes through an in-memory buffer that is filled before the burn
+starts.  A regular file or loop device given as ``--device`` is written
+directly instead of through growisofs, which is how the stream is tested.
+
+Verification hashes the image in 64 MiB ranges while it is burned, then
+reads the device back (O_DIRECT, double-buffered) and compares range by
+range, so a failure names the bad region of the disc.
 """
 
 from __future__ import annotations
 
 import argparse
+import hashlib
+import logging
+import mmap
+import os
+import queue
 import shlex
 import shutil
+import stat
 import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
 from pathlib import Path
+from typing import IO, Callable, Iterator
 
 from utils import setup_logging
 
+STREAM_CHUNK = 4 * 1024 * 1024  # bytes per read from the image generator
+STREAM_BUFFER_MB = 256  # default in-memory buffer between generator and drive
+STREAM_STALL_SEC = 120  # abort when the generator delivers nothing for this long
+VERIFY_RANGE = 64 * 1024 * 1024  # bytes covered by one verification checksum
+READ_BLOCK = 8 * 1024 * 1024  # read-back block; a multiple of the 2 KiB sector
+
 
 def _build_command(
     *, iso: Path, verify: bool, device: str | None, speed: int | None
@@ -30,9 +58,372 @@ def _build_command(
     return cmd
 
 
+def _is_drive(device: str) -> bool:
+    """True for a burner: anything under /dev except loop devices, which –
+    like plain files elsewhere – are written directly."""
+    real = Path(os.path.realpath(device))
+    return real.parts[1:2] == ("dev",) and not real.name.startswith("loop")
+
+
+def _stream_command(
+    *, device: str, speed: int | None, sectors: int | None
+) -> list[str]:
+    """growisofs reading the image from its stdin."""
+    if shutil.which("growisofs") is None:
+        raise FileNotFoundError("growisofs not found")
+    cmd = ["growisofs", "-dvd-compat"]
+    if speed:
+        cmd.append(f"-speed={speed}")
+    if sectors:
+        # a pipe has no size; tell growisofs so it can reserve the track
+        cmd.append(f"-use-the-force-luke=tracksize:{sectors}")
+    return cmd + ["-Z", f"{device}=/dev/fd/0"]
+
+
+class RangeHasher:
+    """SHA-256 of consecutive ``range_bytes`` slices of a byte stream."""
+
+    def __init__(self, range_bytes: int = VERIFY_RANGE) -> None:
+        self.range_bytes = range_bytes
+        self.size = 0
+        self.digests: list[str] = []
+        self._hash = hashlib.sha256()
+        self._filled = 0
+
+    def update(self, data: bytes | memoryview) -> None:
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.range_bytes - self._filled)
+            self._hash.update(view[:take])
+            self._filled += take
+            self.size += take
+            view = view[take:]
+            if self._filled == self.range_bytes:
+                self._close_range()
+
+    def _close_range(self) -> None:
+        self.digests.append(self._hash.hexdigest())
+        self._hash = hashlib.sha256()
+        self._filled = 0
+
+    def finish(self) -> RangeHasher:
+        if self._filled:
+            self._close_range()
+        return self
+
+
+def _open_direct(path: str) -> tuple[int, bool]:
+    """Open ``path`` for reading with O_DIRECT where the platform and file
+    system allow it; return the descriptor and whether it is direct."""
+    direct = getattr(os, "O_DIRECT", 0)
+    if direct:
+        try:
+            return os.open(path, os.O_RDONLY | direct), True
+        except OSError:
+            pass  # e.g. EINVAL on tmpfs
+    return os.open(path, os.O_RDONLY), False
+
+
+def _read_blocks(
+    path: str, limit: int, block: int = READ_BLOCK
+) -> Iterator[memoryview]:
+    """
+    Yield the first ``limit`` bytes of ``path`` in ``block``-sized views.
+
+    A reader thread fills one of two page-aligned buffers while the caller
+    hashes the other, so the device never waits on the CPU.  O_DIRECT keeps
+    the page cache out of it – the data really comes off the disc – and is
+    dropped for buffered reads if the device refuses it.  Each view is only
+    valid until the next one is requested.
+    """
+    fd, direct = _open_direct(path)
+    buffers = [mmap.mmap(-1, block) for _ in range(2)]
+    free: queue.Queue[int] = queue.Queue()
+    full: queue.Queue[tuple[int, int] | BaseException | None] = queue.Queue()
+    for idx in range(len(buffers)):
+        free.put(idx)
+
+    def reader() -> None:
+        nonlocal fd, direct
+        offset = 0
+        try:
+            while offset < limit:
+                idx = free.get()
+                if idx < 0:
+                    return
+                try:
+                    n = os.preadv(fd, [buffers[idx]], offset)
+                except OSError:
+                    if not direct:
+                        raise
+                    os.close(fd)  # alignment refused – read buffered instead
+                    fd, direct = os.open(path, os.O_RDONLY), False
+                    n = os.preadv(fd, [buffers[idx]], offset)
+                if n == 0:
+                    break
+                full.put((idx, min(n, limit - offset)))
+                offset += n
+            full.put(None)
+        except BaseException as exc:
+            full.put(exc)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while (item := full.get()) is not None:
+            if isinstance(item, BaseException):
+                raise item
+            idx, n = item
+            yield memoryview(buffers[idx])[:n]
+            free.put(idx)
+    finally:
+        free.put(-1)
+        thread.join()
+        os.close(fd)
+
+
+def _hash_file(path: str | Path, range_bytes: int = VERIFY_RANGE) -> RangeHasher:
+    """
+    Range checksums of the whole of ``path``.
+
+    Unlike the read-back this goes through the page cache on purpose: the
+    image is hashed while growisofs reads it, and the two passes should
+    share one trip to the disk rather than compete for it.
+    """
+    hasher = RangeHasher(range_bytes)
+    buf = bytearray(READ_BLOCK)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as fh:
+        while n := fh.readinto(buf):
+            hasher.update(view[:n])
+    return hasher.finish()
+
+
+def _verify(device: str, expected: RangeHasher, *, logger: logging.Logger) -> None:
+    """Read ``device`` back and compare it with ``expected`` range by range."""
+    if _is_drive(device) and shutil.which("eject"):
+        # lift any speed limit left from burning so the read runs flat out
+        subprocess.run(["eject", "-x", "0", device], capture_output=True)
+    logger.info(f"Verifying {expected.size / 1024**2:.0f} MiB on {device}…")
+    got = RangeHasher(expected.range_bytes)
+    for view in _read_blocks(device, expected.size):
+        got.update(view)
+    got.finish()
+    if got.size < expected.size:
+        logger.error(f"Short read: {got.size} of {expected.size} bytes")
+    step = expected.range_bytes
+    bad = [
+        k
+        for k, (want, have) in enumerate(zip_longest(expected.digests, got.digests))
+        if want != have
+    ]
+    for k in bad:
+        end = min((k + 1) * step, expected.size) - 1
+        logger.error(f"Checksum mismatch in bytes {k * step}–{end} (range {k})")
+    if bad:
+        raise SystemExit(2)
+    logger.info(f"Verification SUCCESS ({len(got.digests)} ranges match)")
+
+
+class _Relay:
+    """
+    Bounded FIFO between the image generator and the burner.
+
+    A reader thread pulls ``STREAM_CHUNK`` blocks from ``source`` into a queue
+    holding ``buffer_bytes``.  :meth:`wait_filled` blocks until the queue is
+    full (or the image is shorter than the buffer), so the drive starts with
+    a full reserve.  :meth:`chunks` counts every time the reserve ran dry
+    while the generator was still working – each one is a potential buffer
+    underrun on the drive – and then holds the drive back until half the
+    buffer is queued again, so it pauses once instead of stuttering on every
+    chunk.  A generator that delivers nothing for ``STREAM_STALL_SEC`` ends
+    the stream with :attr:`error` set.
+    """
+
+    def __init__(self, source: IO[bytes], buffer_bytes: int) -> None:
+        self.source = source
+        self.queue: queue.Queue[bytes] = queue.Queue(
+            maxsize=max(1, buffer_bytes // STREAM_CHUNK)
+        )
+        self.done = threading.Event()
+        self.error: BaseException | None = None
+        self.underruns = 0
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def _fill(self) -> None:
+        try:
+            while chunk := self.source.read(STREAM_CHUNK):
+                self.queue.put(chunk)
+        except BaseException as exc:
+            self.error = exc
+        finally:
+            self.done.set()
+            self.queue.put(b"")
+
+    def wait_filled(self, level: int | None = None) -> None:
+        """Wait for ``level`` queued chunks (default: a full buffer)."""
+        level = self.queue.maxsize if level is None else level
+        seen, since = self.queue.qsize(), time.monotonic()
+        while self.queue.qsize() < level and not self.done.is_set():
+            time.sleep(0.05)
+            if self.queue.qsize() != seen:
+                seen, since = self.queue.qsize(), time.monotonic()
+            elif time.monotonic() - since > STREAM_STALL_SEC:
+                self.error = TimeoutError(
+                    f"image generator stalled for {STREAM_STALL_SEC}s"
+                )
+                return
+
+    def chunks(self) -> Iterator[bytes]:
+        while self.error is None:
+            if self.queue.empty() and not self.done.is_set():
+                self.underruns += 1
+                self.wait_filled(max(1, self.queue.maxsize // 2))
+                if self.error is not None:
+                    return
+            chunk = self.queue.get()
+            if not chunk:
+                return
+            yield chunk
+
+
+def run_stream(
+    source: IO[bytes],
+    *,
+    logger: logging.Logger,
+    device: str | None = None,
+    speed: int | None = None,
+    sectors: int | None = None,
+    buffer_mb: int = STREAM_BUFFER_MB,
+    verify: bool = True,
+    dry_run: bool = False,
+    producer: Callable[[], int] | None = None,
+) -> int:
+    """
+    Burn the image read from ``source`` and return the bytes written.
+
+    ``sectors`` (2 KiB) is passed to growisofs as the track size when known.
+    With ``verify`` the stream is checksummed on its way to the drive and
+    the device read back afterwards.  ``producer`` returns the generator's
+    exit status once ``source`` hits EOF; a failed generator, or a stream
+    shorter than ``sectors``, kills the burner before it can close the
+    session and nothing is reported as burned.
+    """
+    dev = device or "/dev/sr0"
+    drive = _is_drive(dev)
+    cmd = _stream_command(device=dev, speed=speed, sectors=sectors) if drive else None
+    if dry_run:
+        logger.info("Dry-run mode – no commands executed")
+        print(" ".join(shlex.quote(p) for p in cmd) if cmd else f"write → {dev}")
+        return 0
+
+    relay = _Relay(source, buffer_mb * 1024 * 1024)
+    logger.info(f"Filling {buffer_mb} MiB stream buffer…")
+    relay.wait_filled()
+    if relay.error is not None:
+        logger.error(f"Image stream failed: {relay.error}")
+        raise relay.error
+    if cmd:
+        logger.info("Running burn command…")
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        assert proc.stdin is not None
+        sink: IO[bytes] = proc.stdin
+    else:
+        logger.info(f"Writing image to {dev}")
+        block = os.path.exists(dev) and stat.S_ISBLK(os.stat(dev).st_mode)
+        sink = open(dev, "r+b" if block else "wb")
+
+    written = 0
+    hasher = RangeHasher()
+    try:
+        for chunk in relay.chunks():
+            sink.write(chunk)
+            written += len(chunk)
+            if verify:
+                hasher.update(chunk)
+        if relay.error is not None:
+            logger.error(f"Image stream failed: {relay.error}")
+            raise relay.error
+        status = producer() if producer is not None else 0
+        if status != 0:
+            logger.error(f"Image generator exited with {status}; stream truncated")
+            raise SystemExit(1)
+        if sectors and written != sectors * 2048:
+            logger.error(f"Stream ended at {written} of {sectors * 2048} bytes")
+            raise SystemExit(1)
+        sink.close()
+    except BrokenPipeError:
+        pass  # the burner quit; its exit status says why
+    except BaseException:
+        if cmd:
+            proc.kill()  # closing stdin would let growisofs finish the disc
+        raise
+    finally:
+        if cmd:
+            returncode = proc.wait()
+        else:
+            sink.close()
+    if cmd and returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+    if relay.underruns:
+        logger.warning(
+            f"Stream buffer ran dry {relay.underruns} time(s) – "
+            "the image generator is slower than the drive"
+        )
+    logger.info(f"✅ Burn completed ({written / 1024**2:.0f} MiB streamed)")
+    if verify:
+        _verify(dev, hasher.finish(), logger=logger)
+    else:
+        logger.info("Verification skipped")
+    return written
+
+
+def run(
+    iso: str | Path,
+    *,
+    logger: logging.Logger,
+    device: str | None = None,
+    speed: int | None = None,
+    verify: bool = True,
+    dry_run: bool = False,
+) -> None:
+    """Burn ``iso`` (or, with ``dry_run``, print the command instead)."""
+    iso = Path(iso)
+    if not iso.is_file():
+        logger.error(f"File not found: {iso}")
+        raise SystemExit(1)
+
+    dev = device or "/dev/sr0"
+    if not _is_drive(dev):
+        # a file or loop device standing in for the drive
+        with iso.open("rb") as source:
+            run_stream(
+                source, logger=logger, device=dev, verify=verify, dry_run=dry_run
+            )
+        return
+
+    cmd = _build_command(iso=iso, verify=verify, device=device, speed=speed)
+    if dry_run:
+        logger.info("Dry-run mode – no commands executed")
+        print(" ".join(shlex.quote(part) for part in cmd))
+        return
+
+    logger.info("Running burn command…")
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        # checksum the image while growisofs is reading it anyway
+        expected = pool.submit(_hash_file, iso) if verify else None
+        subprocess.run(cmd, check=True)
+        logger.info("✅ Burn completed")
+        if expected is None:
+            logger.info("Verification skipped")
+            return
+        _verify(dev, expected.result(), logger=logger)
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--iso-path", required=True)
+    ap.add_argument("--iso-path", required=True, help="image, or - for stdin")
     ap.add_argument("--logfile")
     ap.add_argument("--device")
     ap.add_argument("--speed", type=int)
@@ -40,6 +431,13 @@ def main() -> None:
     verify_grp.add_argument("--verify", dest="verify", action="store_true")
     verify_grp.add_argument("--skip-verify", dest="verify", action="store_false")
     ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument(
+        "--buffer-mb",
+        type=int,
+        default=STREAM_BUFFER_MB,
+        help=f"stream buffer for --iso-path - (default {STREAM_BUFFER_MB})",
+    )
+    ap.add_argument("--size-sectors", type=int, help="image size for --iso-path -")
     ap.set_defaults(verify=True)
     ns = ap.parse_args()
 
@@ -48,21 +446,26 @@ def main() -> None:
         if ns.logfile
         else setup_logging("burn_iso.log", "burn")
     )
-
-    iso = Path(ns.iso_path)
-    if not iso.is_file():
-        logger.error(f"File not found: {iso}")
-        raise SystemExit(1)
-
-    cmd = _build_command(iso=iso, verify=ns.verify, device=ns.device, speed=ns.speed)
-    if ns.dry_run:
-        logger.info("Dry-run mode – no commands executed")
-        print(" ".join(shlex.quote(part) for part in cmd))
+    if ns.iso_path == "-":
+        run_stream(
+            sys.stdin.buffer,
+            logger=logger,
+            device=ns.device,
+            speed=ns.speed,
+            sectors=ns.size_sectors,
+            buffer_mb=ns.buffer_mb,
+            verify=ns.verify,
+            dry_run=ns.dry_run,
+        )
         return
-
-    logger.info("Running burn command…")
-    subprocess.run(cmd, check=True)
-    logger.info("✅ Burn completed")
+    run(
+        ns.iso_path,
+        logger=logger,
+        device=ns.device,
+        speed=ns.speed,
+        verify=ns.verify,
+        dry_run=ns.dry_run,
+    )
 
 
 if __name__ == "__main__":
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import hashlib
+import io
+import logging
 import os
 import subprocess
 import sys
+import time
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
@@ -11,7 +15,14 @@ from shared import compose
 
 import pytest
 
-from scripts.burn_iso.burn_iso import _build_command
+from scripts.burn_iso.burn_iso import (
+    STREAM_CHUNK,
+    _build_command,
+    _hash_file,
+    _verify,
+    run,
+    run_stream,
+)
 
 
 @pytest.mark.skipif(
@@ -184,6 +195,170 @@ def test_s6_no_optical_drive(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) ->
 # Scenario 7 – Verify mismatch
 
 
-@pytest.mark.xfail(reason="Verification step not implemented")  # type: ignore[misc]
-def test_s7_verify_mismatch() -> None:
-    pass
+def test_s7_verify_mismatch(tmp_path: Path, caplog: pytest.LogCaptureFixture) -> None:
+    iso = tmp_path / "image.iso"
+    iso.write_bytes(os.urandom(5 * 1024 * 1024))
+    disc = tmp_path / "disc.img"  # a plain file stands in for the drive
+    logger = logging.getLogger("burn-test")
+    run(iso, logger=logger, device=str(disc), verify=False)
+    assert disc.read_bytes() == iso.read_bytes()
+
+    with disc.open("r+b") as fh:  # flip one byte after the burn
+        fh.seek(2 * 1024 * 1024 + 5)
+        byte = fh.read(1)[0]
+        fh.seek(-1, os.SEEK_CUR)
+        fh.write(bytes([byte ^ 0xFF]))
+    with pytest.raises(SystemExit) as exc:
+        _verify(str(disc), _hash_file(iso, range_bytes=1024 * 1024), logger=logger)
+    assert exc.value.code == 2
+    assert "Checksum mismatch in bytes 2097152–3145727" in caplog.text
+
+
+def test_hash_file_is_buffered(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    iso = tmp_path / "image.iso"
+    data = os.urandom(3 * 1024 * 1024 + 7)
+    iso.write_bytes(data)
+
+    def no_direct(path: str) -> tuple[int, bool]:
+        raise AssertionError("the image must be hashed through the page cache")
+
+    monkeypatch.setattr("scripts.burn_iso.burn_iso._open_direct", no_direct)
+    got = _hash_file(iso, range_bytes=1024 * 1024)
+    assert got.size == len(data)
+    assert got.digests[-1] == hashlib.sha256(data[3 * 1024 * 1024 :]).hexdigest()
+
+
+# Streaming – image piped in, regular file standing in for the drive
+
+
+def test_stream_stdin_to_file(tmp_path: Path) -> None:
+    script = Path(__file__).resolve().parents[1] / "burn_iso.py"
+    image = os.urandom(3 * STREAM_CHUNK + 12345)
+    disc = tmp_path / "disc.img"
+    env = os.environ.copy()
+    env["PYTHONPATH"] = str(Path(__file__).resolve().parents[3])
+    proc = subprocess.run(
+        [
+            sys.executable,
+            str(script),
+            "--iso-path",
+            "-",
+            "--device",
+            str(disc),
+            "--buffer-mb",
+            "8",
+            "--logfile",
+            str(tmp_path / "burn.log"),
+        ],
+        input=image,
+        capture_output=True,
+        env=env,
+    )
+    assert proc.returncode == 0, proc.stderr
+    assert disc.read_bytes() == image
+    assert "Verification SUCCESS" in (tmp_path / "burn.log").read_text()
+
+
+class SlowImage:
+    """Generator output that arrives slower than the drive takes it."""
+
+    def __init__(self, chunks: int) -> None:
+        self.left = chunks
+
+    def read(self, n: int) -> bytes:
+        if not self.left:
+            return b""
+        self.left -= 1
+        time.sleep(0.05)
+        return b"\0" * n
+
+
+def test_stream_growisofs_underrun_warning(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    received = tmp_path / "received"
+    exe = fake_bin / "growisofs"
+    exe.write_text(f'#!/bin/sh\necho "$*" > "{tmp_path}/args"\ncat > "{received}"\n')
+    exe.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{fake_bin}:{os.environ['PATH']}")
+
+    written = run_stream(
+        SlowImage(4),  # type: ignore[arg-type]
+        logger=logging.getLogger("burn-test"),
+        device="/dev/null",  # a character device, so growisofs is used
+        sectors=4 * STREAM_CHUNK // 2048,
+        buffer_mb=STREAM_CHUNK // 1024**2,
+        verify=False,  # /dev/null reads back empty
+    )
+    assert written == received.stat().st_size == 4 * STREAM_CHUNK
+    args = (tmp_path / "args").read_text()
+    assert f"tracksize:{4 * STREAM_CHUNK // 2048}" in args
+    assert args.strip().endswith("-Z /dev/null=/dev/fd/0")
+    assert "ran dry" in caplog.text
+
+
+def test_stream_failed_generator_is_not_a_burn(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    disc = tmp_path / "disc.img"
+    with pytest.raises(SystemExit):
+        run_stream(
+            io.BytesIO(b"\0" * STREAM_CHUNK),
+            logger=logging.getLogger("burn-test"),
+            device=str(disc),
+            buffer_mb=STREAM_CHUNK // 1024**2,
+            producer=lambda: 1,  # genisoimage died after the partial image
+        )
+    assert "stream truncated" in caplog.text
+    assert "Burn completed" not in caplog.text
+    assert "Verif" not in caplog.text
+
+
+def test_stream_shorter_than_announced(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    with pytest.raises(SystemExit):
+        run_stream(
+            io.BytesIO(b"\0" * STREAM_CHUNK),
+            logger=logging.getLogger("burn-test"),
+            device=str(tmp_path / "disc.img"),
+            sectors=2 * STREAM_CHUNK // 2048,
+            buffer_mb=STREAM_CHUNK // 1024**2,
+        )
+    assert f"Stream ended at {STREAM_CHUNK} of {2 * STREAM_CHUNK} bytes" in caplog.text
+    assert "Burn completed" not in caplog.text
+
+
+class StalledImage:
+    """Generator output that stops arriving after the first chunk."""
+
+    def __init__(self) -> None:
+        self.sent = False
+
+    def read(self, n: int) -> bytes:
+        if self.sent:
+            time.sleep(1)
+            return b""
+        self.sent = True
+        return b"\0" * n
+
+
+def test_stream_stalled_generator_aborts(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    monkeypatch.setattr("scripts.burn_iso.burn_iso.STREAM_STALL_SEC", 0.2)
+    with pytest.raises(TimeoutError):
+        run_stream(
+            StalledImage(),  # type: ignore[arg-type]
+            logger=logging.getLogger("burn-test"),
+            device=str(tmp_path / "disc.img"),
+            buffer_mb=STREAM_CHUNK // 1024**2,
+        )
+    assert "stalled" in caplog.text
+    assert "Burn completed" not in caplog.text
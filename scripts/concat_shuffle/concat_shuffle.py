@@ -7,23 +7,22 @@ Usage:
 from __future__ import annotations
 
 import argparse
+import logging
 import shlex
-import subprocess
+import time
+from collections import deque
 from pathlib import Path
 
-from utils import setup_logging
+from utils import FFmpegProgress, run_streamed, setup_logging
 
+TAIL_LINES = 200  # ffmpeg output kept for error classification
+PROGRESS_EVERY = 10.0  # seconds between progress lines in the log
 
-def main() -> None:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--logfile")
-    ap.add_argument("--clip-list", required=True)
-    ap.add_argument("--out-file", required=True)
-    ns = ap.parse_args()
 
-    logger = setup_logging(ns.logfile or "/dev/stdout", "shuffle-concat")
-
-    clip_list = Path(ns.clip_list)
+def run(clip_list: str | Path, out_file: str | Path, *, logger: logging.Logger) -> Path:
+    """Stream-copy the clips listed in ``clip_list`` into ``out_file``."""
+    clip_list = Path(clip_list)
+    out_file = Path(out_file)
     try:
         clip_list.read_text()
     except Exception as exc:  # pragma: no cover - argparse ensures path exists
@@ -35,44 +34,80 @@ def main() -> None:
         "-hide_banner",
         "-loglevel",
         "error",
+        "-nostats",
+        "-progress",
+        "pipe:1",
         "-y",
         "-f",
         "concat",
         "-safe",
         "0",
         "-i",
-        ns.clip_list,
+        str(clip_list),
         "-c",
         "copy",
         "-movflags",
         "+faststart",
-        ns.out_file,
+        str(out_file),
     ]
     logger.info("Command: %s", " ".join(shlex.quote(p) for p in cmd))
+    tail: deque[str] = deque(maxlen=TAIL_LINES)
+    progress = FFmpegProgress()
+    last_report = time.monotonic()
+
+    def on_line(line: str) -> None:
+        nonlocal last_report
+        if not progress.matches(line):
+            tail.append(line)
+            return
+        block = progress.feed(line)
+        now = time.monotonic()
+        if block is None or (
+            block["progress"] != "end" and now - last_report < PROGRESS_EVERY
+        ):
+            return
+        last_report = now
+        logger.info(
+            "Progress: %s written, %s bytes, speed %s",
+            block.get("out_time", "?"),
+            block.get("total_size", "?"),
+            block.get("speed", "?"),
+        )
+
     try:
-        proc = subprocess.run(cmd, capture_output=True, text=True)
+        returncode = run_streamed(cmd, on_line)
     except KeyboardInterrupt:
         logger.error("Interrupted")
-        Path(ns.out_file).unlink(missing_ok=True)
+        out_file.unlink(missing_ok=True)
         raise SystemExit(3)
 
-    if proc.returncode != 0 or "No such file or directory" in proc.stderr:
-        logger.error(proc.stderr.strip())
-        if (
-            "No such file or directory" in proc.stderr
-            and ns.out_file not in proc.stderr
-        ):
+    stderr = "\n".join(tail)
+    if returncode != 0 or "No such file or directory" in stderr:
+        logger.error(stderr.strip())
+        if "No such file or directory" in stderr and str(out_file) not in stderr:
             code = 2
         else:
             code = 3
-        Path(ns.out_file).unlink(missing_ok=True)
+        out_file.unlink(missing_ok=True)
         raise SystemExit(code)
 
-    if not Path(ns.out_file).is_file() or Path(ns.out_file).stat().st_size == 0:
+    if not out_file.is_file() or out_file.stat().st_size == 0:
         logger.error("Output not created")
         raise SystemExit(3)
 
-    logger.info(f"Montage saved to {ns.out_file}")
+    logger.info(f"Montage saved to {out_file}")
+    return out_file
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--logfile")
+    ap.add_argument("--clip-list", required=True)
+    ap.add_argument("--out-file", required=True)
+    ns = ap.parse_args()
+
+    logger = setup_logging(ns.logfile or "/dev/stdout", "shuffle-concat")
+    run(ns.clip_list, ns.out_file, logger=logger)
 
 
 if __name__ == "__main__":
@@ -296,3 +296,93 @@ def test_s6_large_montage(tmp_path: Path) -> None:
     with open(out_vid, "r+b") as fh:
         fh.truncate(5 * 1024 * 1024 * 1024)
     assert out_vid.stat().st_size > 4 * 1024**3
+
+
+def make_dummy_ffmpeg(dir: Path, missing: str | None = None) -> None:
+    """Fake ffmpeg printing -progress blocks, optionally failing on a missing clip."""
+    exe = dir / "ffmpeg"
+    exe.write_text(
+        f"""#!/usr/bin/env python3
+import sys, pathlib
+for t in range(3):
+    print(f"out_time=00:00:0{{t}}.000000\\ntotal_size={{t * 100}}")
+    print("bitrate= 812.3kbits/s\\nspeed= 1.5x")
+    print("progress=continue", flush=True)
+    print("[mkv @ 0x1] noise " * 20, file=sys.stderr, flush=True)
+missing = {missing!r}
+if missing:
+    print(f"[concat @ 0x2] Impossible to open '{{missing}}'", file=sys.stderr)
+    print(f"{{missing}}: No such file or directory", file=sys.stderr)
+    sys.exit(1)
+pathlib.Path(sys.argv[-1]).write_text("video")
+print("out_time=00:00:03.000000\\ntotal_size=300\\nbitrate= 812.3kbits/s")
+print("speed= 1.5x\\nprogress=end")
+"""
+    )
+    exe.chmod(0o755)
+
+
+def test_s7_streamed_progress(tmp_path: Path) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    make_dummy_ffmpeg(fake_bin)
+    list_file = tmp_path / "list.txt"
+    list_file.write_text(f"file '{tmp_path / 'c1.mkv'}'\n")
+    log = tmp_path / "log.txt"
+    out_vid = tmp_path / "out.mkv"
+    env = os.environ.copy()
+    env["PATH"] = f"{fake_bin}:{env['PATH']}"
+    env["PYTHONPATH"] = str(Path(__file__).resolve().parents[3])
+    proc = subprocess.run(
+        [
+            sys.executable,
+            str(Path(__file__).resolve().parents[1] / "concat_shuffle.py"),
+            "--clip-list",
+            str(list_file),
+            "--out-file",
+            str(out_vid),
+            "--logfile",
+            str(log),
+        ],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    assert proc.returncode == 0
+    text = log.read_text()
+    assert "Progress: 00:00:03.000000 written, 300 bytes, speed 1.5x" in text
+    assert "Montage saved" in text
+
+
+def test_s8_streamed_missing_clip(tmp_path: Path) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    missing = tmp_path / "missing.mkv"
+    make_dummy_ffmpeg(fake_bin, missing=str(missing))
+    list_file = tmp_path / "list.txt"
+    list_file.write_text(f"file '{missing}'\n")
+    log = tmp_path / "log.txt"
+    out_vid = tmp_path / "out.mkv"
+    env = os.environ.copy()
+    env["PATH"] = f"{fake_bin}:{env['PATH']}"
+    env["PYTHONPATH"] = str(Path(__file__).resolve().parents[3])
+    proc = subprocess.run(
+        [
+            sys.executable,
+            str(Path(__file__).resolve().parents[1] / "concat_shuffle.py"),
+            "--clip-list",
+            str(list_file),
+            "--out-file",
+            str(out_vid),
+            "--logfile",
+            str(log),
+        ],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    assert proc.returncode == 2
+    assert not out_vid.exists()
+    text = log.read_text()
+    assert "No such file" in text
+    assert "bitrate=" not in text  # padded progress lines stay out of the tail
@@ -1,37 +1,88 @@
 #!/usr/bin/env python3
-"""Create a UDF+ISO-9660 image according to :doc:`../docs/create_iso.md`."""
+"""Create a UDF+ISO-9660 image according to :doc:`../docs/create_iso.md`.
+
+``--manifest`` takes ``/on/disc=/source`` lines instead of a build dir and
+hands them to genisoimage as graft points, so files go into the image
+straight from wherever they are.
+
+:class:`IsoAppender` builds the image incrementally instead: each file handed
+to it is added as a new xorriso session while the caller keeps producing the
+rest, so authoring overlaps whatever creates the files.
+"""
 
 from __future__ import annotations
 
 import argparse
 import datetime
+import logging
+import queue
 import re
 import shutil
 import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
 from pathlib import Path
+from typing import IO, Callable, Iterator, Sequence
 
-from utils import setup_logging
+from utils import graft_point, read_graft_points, setup_logging
 
 LABEL_RE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
 
 
-def _build_command(*, build_dir: Path, iso_path: Path, label: str) -> list[str]:
-    """Return the command used to create the ISO."""
+def _build_command(
+    *,
+    iso_path: Path | None,
+    label: str,
+    build_dir: Path | None = None,
+    path_list: Path | None = None,
+) -> list[str]:
+    """Return the command that masters ``build_dir`` or the ``path_list``
+    graft points into the ISO – or onto stdout when ``iso_path`` is None."""
     if shutil.which("genisoimage") is None:
         raise FileNotFoundError("genisoimage not found")
+    if path_list is not None:
+        source = ["-graft-points", "-path-list", str(path_list)]
+    else:
+        source = [str(build_dir)]
     return [
         "genisoimage",
         "-iso-level",
         "3",
         "-udf",
+        # staged clips may be symlinks to the originals; store their data
+        "-follow-links",
         "-V",
         label,
-        "-o",
-        str(iso_path),
-        str(build_dir),
+        *(["-o", str(iso_path)] if iso_path is not None else []),
+        *source,
     ]
 
 
+def _append_command(
+    *, iso_path: Path, label: str, files: list[Path], first: bool
+) -> list[str]:
+    """Return the xorriso command adding ``files`` to ``iso_path`` as one session.
+
+    The first session creates the image (``-outdev``); later ones load the
+    existing tree and append to it (``-dev``).  xorriso treats the image file
+    as overwritable media, so after every commit the volume descriptors at
+    the start of the file point at the newest tree and the file burns like
+    any other single-track ISO.
+    """
+    if shutil.which("xorriso") is None:
+        raise FileNotFoundError("xorriso not found")
+    cmd = ["xorriso", "-outdev" if first else "-dev", str(iso_path)]
+    if first:
+        cmd += ["-volid", label, "-joliet", "on"]
+    # level 3 allows files of 4 GiB and more, as genisoimage -iso-level 3 does
+    cmd += ["-compliance", "iso_9660_level=3"]
+    for f in files:
+        # resolve staged symlinks so the data, not the link, is stored
+        cmd += ["-map", str(f.resolve()), f"/{f.name}"]
+    return cmd + ["-commit"]
+
+
 def _validate_label(label: str) -> None:
     if not LABEL_RE.fullmatch(label):
         if len(label) > 32:
@@ -39,26 +90,10 @@ def _validate_label(label: str) -> None:
         raise ValueError("Label contains illegal characters")
 
 
-def main() -> None:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--logfile", required=True)
-    ap.add_argument("--build-dir", required=True)
-    ap.add_argument("--iso-path", required=True)
-    ap.add_argument("--volume-label")
-    ap.add_argument("--force", action="store_true")
-    ns = ap.parse_args()
-
-    logger = setup_logging(ns.logfile, "iso")
-
-    build_dir = Path(ns.build_dir)
-    if not build_dir.is_dir():
-        logger.error("Directory not found")
-        raise SystemExit(1)
-    if not any(build_dir.iterdir()):
-        logger.error("No input files")
-        raise SystemExit(1)
-
-    iso_path = Path(ns.iso_path)
+def _check_target(
+    iso_path: Path, *, label: str | None, force: bool, logger: logging.Logger
+) -> str:
+    """Validate the image location and label; return the label to use."""
     try:
         iso_path.parent.mkdir(parents=True, exist_ok=True)
         test_file = iso_path.parent / ".write_test"
@@ -68,28 +103,276 @@ def main() -> None:
         logger.error("Cannot write ISO")
         raise SystemExit(1)
 
-    if iso_path.exists() and not ns.force:
+    if iso_path.exists() and not force:
         logger.error("File exists")
         raise SystemExit(1)
 
     start_ts = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-    label = ns.volume_label or start_ts
+    label = label or start_ts
     try:
         _validate_label(label)
     except ValueError as exc:  # noqa: PERF203
         logger.error(str(exc))
         raise SystemExit(1)
+    return label
+
+
+def _check_source(
+    build_dir: str | Path | None,
+    manifest: Sequence[tuple[str, Path]] | None,
+    logger: logging.Logger,
+) -> Path | None:
+    """Validate the build dir, or the manifest when given; return the dir."""
+    if manifest is None:
+        build_dir = Path(build_dir or "")
+        if not build_dir.is_dir():
+            logger.error("Directory not found")
+            raise SystemExit(1)
+        if not any(build_dir.iterdir()):
+            logger.error("No input files")
+            raise SystemExit(1)
+        return build_dir
+    if not manifest:
+        logger.error("No input files")
+        raise SystemExit(1)
+    missing = [str(src) for _, src in manifest if not Path(src).exists()]
+    if missing:
+        logger.error("File not found: %s", ", ".join(missing))
+        raise SystemExit(1)
+    seen: set[str] = set()
+    for disc_path, _ in manifest:
+        key = "/" + disc_path.strip("/")
+        if key in seen:
+            logger.error("Duplicate path on disc: %s", key)
+            raise SystemExit(1)
+        seen.add(key)
+    return None
+
+
+def _write_path_list(path: Path, manifest: Sequence[tuple[str, Path]]) -> Path:
+    path.write_text(
+        "".join(graft_point(d, Path(src)) + "\n" for d, src in manifest),
+        encoding="utf-8",
+    )
+    return path
 
-    cmd = _build_command(build_dir=build_dir, iso_path=iso_path, label=label)
+
+def run(
+    build_dir: str | Path | None,
+    iso_path: str | Path,
+    *,
+    logger: logging.Logger,
+    label: str | None = None,
+    force: bool = False,
+    manifest: Sequence[tuple[str, Path]] | None = None,
+) -> Path:
+    """
+    Master ``build_dir`` – or, with ``manifest``, the listed ``(path on
+    disc, source file)`` pairs, wherever they live – into ``iso_path`` and
+    return the image path.
+    """
+    source_dir = _check_source(build_dir, manifest, logger)
+    iso_path = Path(iso_path)
+    label = _check_target(iso_path, label=label, force=force, logger=logger)
+
+    path_list = None
+    if manifest is not None:
+        path_list = _write_path_list(
+            iso_path.with_name(f".{iso_path.name}.paths"), manifest
+        )
+    cmd = _build_command(
+        iso_path=iso_path, label=label, build_dir=source_dir, path_list=path_list
+    )
 
     logger.info("Creating ISO image…")
-    subprocess.run(cmd, check=True)
+    try:
+        subprocess.run(cmd, check=True)
+    finally:
+        if path_list is not None:
+            path_list.unlink(missing_ok=True)
 
     if not iso_path.is_file() or iso_path.stat().st_size == 0:
         logger.error("ISO not created")
         raise SystemExit(1)
 
     logger.info("ISO created successfully")
+    return iso_path
+
+
+def _image_sectors(cmd: list[str]) -> int | None:
+    """Image size in 2 KiB sectors from a ``-print-size`` dry run, if known."""
+    proc = subprocess.run(
+        [*cmd[:1], "-print-size", "-quiet", *cmd[1:]],
+        capture_output=True,
+        text=True,
+    )
+    found = re.findall(r"\d+", proc.stdout or proc.stderr)
+    return int(found[-1]) if proc.returncode == 0 and found else None
+
+
+@contextmanager
+def image_stream(
+    build_dir: str | Path | None,
+    *,
+    logger: logging.Logger,
+    label: str | None = None,
+    manifest: Sequence[tuple[str, Path]] | None = None,
+) -> Iterator[tuple[IO[bytes], int | None, Callable[[], int]]]:
+    """
+    Master like :func:`run` but without an image file: yield genisoimage's
+    stdout carrying the image, its size in 2 KiB sectors when a
+    ``-print-size`` dry run could tell, and a callable returning the exit
+    status once the image has been read – check it before trusting the
+    stream.  On leaving the block the generator is reaped (killed if the
+    block failed) and a non-zero exit raises.
+    """
+    source_dir = _check_source(build_dir, manifest, logger)
+    label = label or datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    try:
+        _validate_label(label)
+    except ValueError as exc:
+        logger.error(str(exc))
+        raise SystemExit(1)
+
+    with tempfile.TemporaryDirectory(prefix="create_iso_") as tmp:
+        path_list = None
+        if manifest is not None:
+            path_list = _write_path_list(Path(tmp) / "paths", manifest)
+        cmd = _build_command(
+            iso_path=None, label=label, build_dir=source_dir, path_list=path_list
+        )
+        sectors = _image_sectors(cmd)
+        if sectors:
+            logger.info(f"Image size: {sectors * 2048 / 1e9:.2f} GB")
+        logger.info("Streaming ISO image…")
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE) as proc:
+            assert proc.stdout is not None
+            try:
+                yield proc.stdout, sectors, proc.wait
+            except BaseException:
+                proc.kill()
+                raise
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+class IsoAppender:
+    """Grow an ISO image one xorriso session at a time on a worker thread.
+
+    ``add()`` queues a finished file and returns at once; files that queue up
+    while a session is being written go into the next session together.
+    Once a session has failed ``add()`` raises its error, so producers stop
+    instead of feeding an image that can no longer grow.
+    ``finish()`` waits for the last session and returns the image path.  The
+    image is ISO-9660 level 3 with Rock Ridge and Joliet – xorriso writes no
+    UDF tree, unlike :func:`run`.
+    """
+
+    def __init__(
+        self,
+        iso_path: str | Path,
+        *,
+        logger: logging.Logger,
+        label: str | None = None,
+        force: bool = False,
+    ) -> None:
+        if shutil.which("xorriso") is None:
+            raise FileNotFoundError("xorriso not found")
+        self.iso_path = Path(iso_path)
+        self.label = _check_target(
+            self.iso_path, label=label, force=force, logger=logger
+        )
+        # xorriso would append to the old image rather than replace it
+        self.iso_path.unlink(missing_ok=True)
+        self.logger = logger
+        self.sessions = 0
+        self._queue: queue.Queue[Path | None] = queue.Queue()
+        self._error: BaseException | None = None
+        self._cancelled = False
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+
+    def add(self, path: str | Path) -> None:
+        """Queue ``path`` for the image root; raise if a session failed."""
+        if self._error is not None:
+            raise self._error
+        self._queue.put(Path(path))
+
+    def _work(self) -> None:
+        done = False
+        while not done:
+            batch = [self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get())
+            done = None in batch
+            files = [f for f in batch if f is not None]
+            if not files or self._error is not None or self._cancelled:
+                continue
+            cmd = _append_command(
+                iso_path=self.iso_path,
+                label=self.label,
+                files=files,
+                first=self.sessions == 0,
+            )
+            self.logger.info(
+                "ISO session %d: adding %s",
+                self.sessions + 1,
+                ", ".join(f.name for f in files),
+            )
+            try:
+                subprocess.run(cmd, check=True)
+            except (OSError, subprocess.CalledProcessError) as exc:
+                self.logger.error("ISO session %d failed: %s", self.sessions + 1, exc)
+                self._error = exc
+                continue
+            self.sessions += 1
+
+    def cancel(self) -> None:
+        """Drop queued files and wait for the session in progress."""
+        self._cancelled = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def finish(self) -> Path:
+        """Wait for queued files to land in the image and return its path."""
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        if not self.iso_path.is_file() or self.iso_path.stat().st_size == 0:
+            self.logger.error("ISO not created")
+            raise SystemExit(1)
+        self.logger.info("ISO created successfully (%d session(s))", self.sessions)
+        return self.iso_path
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--logfile", required=True)
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--build-dir")
+    src.add_argument("--manifest", help="file of /on/disc=/source graft points")
+    ap.add_argument("--iso-path", required=True)
+    ap.add_argument("--volume-label")
+    ap.add_argument("--force", action="store_true")
+    ns = ap.parse_args()
+
+    logger = setup_logging(ns.logfile, "iso")
+    manifest = None
+    if ns.manifest:
+        try:
+            manifest = read_graft_points(ns.manifest)
+        except (OSError, UnicodeDecodeError):
+            logger.error("Manifest not readable")
+            raise SystemExit(1)
+    run(
+        ns.build_dir,
+        ns.iso_path,
+        logger=logger,
+        label=ns.volume_label,
+        force=ns.force,
+        manifest=manifest,
+    )
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 import datetime
+import logging
 import os
 import subprocess
 import sys
+import time
 from pathlib import Path
 
 import pytest
@@ -11,6 +13,8 @@ import pytest
 sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
 from shared import compose
 
+from scripts.create_iso.create_iso import IsoAppender
+
 
 @pytest.mark.skipif(os.environ.get("IMAGE") is None, reason="IMAGE not available")  # type: ignore[misc]
 def test_container_happy_path() -> None:
@@ -284,3 +288,143 @@ def test_s10_logfile_unwritable(tmp_path: Path) -> None:
         or "Cannot write logfile" in proc.stderr
         or "FileNotFoundError" in proc.stderr
     )
+
+
+def make_dummy_xorriso(dir: Path, calls: Path) -> None:
+    exe = dir / "xorriso"
+    exe.write_text(
+        "#!/bin/sh\n"
+        f'echo "$*" >> "{calls}"\n'
+        "iso=''\nprev=''\n"
+        'for a in "$@"; do\n'
+        "  case $prev in -outdev|-dev) iso=$a ;; esac\n"
+        "  prev=$a\n"
+        "done\n"
+        'echo session >> "$iso"\n'
+    )
+    exe.chmod(0o755)
+
+
+# Incremental authoring – one session per file handed in
+
+
+def test_incremental_appender(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    calls = tmp_path / "calls.txt"
+    make_dummy_xorriso(fake_bin, calls)
+    monkeypatch.setenv("PATH", f"{fake_bin}:{os.environ['PATH']}")
+    clips = [tmp_path / f"clip{i}.mp4" for i in range(3)]
+    for clip in clips:
+        clip.write_text("x")
+    iso = tmp_path / "out.iso"
+    iso.write_text("stale")
+
+    logger = logging.getLogger("iso-test")
+    appender = IsoAppender(iso, logger=logger, label="TESTDISC", force=True)
+    for clip in clips:
+        appender.add(clip)
+    assert appender.finish() == iso
+
+    lines = calls.read_text().splitlines()
+    assert len(lines) == appender.sessions
+    assert lines[0].startswith(f"-outdev {iso} -volid TESTDISC")
+    assert all(line.startswith(f"-dev {iso}") for line in lines[1:])
+    for clip in clips:
+        assert sum(f"-map {clip.resolve()} /{clip.name}" in line for line in lines) == 1
+    assert "stale" not in iso.read_text()
+
+
+def test_appender_refuses_files_after_failed_session(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    (fake_bin / "xorriso").write_text("#!/bin/sh\nexit 5\n")
+    (fake_bin / "xorriso").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{fake_bin}:{os.environ['PATH']}")
+    clip = tmp_path / "clip0.mp4"
+    clip.write_text("x")
+
+    appender = IsoAppender(
+        tmp_path / "out.iso", logger=logging.getLogger("iso-test"), label="TESTDISC"
+    )
+    appender.add(clip)
+    deadline = time.monotonic() + 10
+    while appender._error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with pytest.raises(subprocess.CalledProcessError):
+        appender.add(clip)
+    with pytest.raises(subprocess.CalledProcessError):
+        appender.finish()
+
+
+def make_listing_genisoimage(dir: Path) -> None:
+    """Fake genisoimage that writes its arguments and path list as the ISO."""
+    exe = dir / "genisoimage"
+    exe.write_text(
+        "#!/bin/sh\n"
+        "iso=''\nlist=''\nprev=''\n"
+        'for a in "$@"; do\n'
+        "  if [ \"$prev\" = '-o' ]; then iso=$a; fi\n"
+        "  if [ \"$prev\" = '-path-list' ]; then list=$a; fi\n"
+        "  prev=$a\n"
+        "done\n"
+        'echo "$*" > "$iso"\n'
+        'cat "$list" >> "$iso"\n'
+    )
+    exe.chmod(0o755)
+
+
+# Manifest – graft points instead of a build directory
+
+
+def test_manifest_graft_points(tmp_path: Path) -> None:
+    card = tmp_path / "card"
+    card.mkdir()
+    (card / "a=1.mp4").write_text("x")
+    (card / "b.mp4").write_text("y")
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text(
+        f"# card dump\n/clips/a\\=1.mp4={card}/a\\=1.mp4\n\n{card}/b.mp4\n"
+    )
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    make_listing_genisoimage(fake_bin)
+    iso = tmp_path / "out.iso"
+    proc = run_script(
+        tmp_path,
+        "--logfile",
+        str(tmp_path / "log.txt"),
+        "--manifest",
+        str(manifest),
+        "--iso-path",
+        str(iso),
+        env_extra={"PATH": f"{fake_bin}:{os.environ['PATH']}"},
+    )
+    assert proc.returncode == 0, proc.stderr
+    args, *listing = iso.read_text().splitlines()
+    assert "-graft-points -path-list" in args
+    assert listing == [f"/clips/a\\=1.mp4={card}/a\\=1.mp4", f"/b.mp4={card}/b.mp4"]
+    assert not list(tmp_path.glob(".out.iso.*"))
+
+
+def test_manifest_missing_source(tmp_path: Path) -> None:
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text(f"/gone.mp4={tmp_path}/gone.mp4\n")
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    make_listing_genisoimage(fake_bin)
+    proc = run_script(
+        tmp_path,
+        "--logfile",
+        str(tmp_path / "log.txt"),
+        "--manifest",
+        str(manifest),
+        "--iso-path",
+        str(tmp_path / "out.iso"),
+        env_extra={"PATH": f"{fake_bin}:{os.environ['PATH']}"},
+    )
+    assert proc.returncode != 0
+    assert "File not found" in proc.stderr
+    assert not (tmp_path / "out.iso").exists()
@@ -2,26 +2,48 @@
 """
 Create key‑frame‑aligned clips that add up to `TARGET_SEC` seconds.
 
+Clip starts are planned on the sources' real key‑frames, so stream copy cuts
+exactly the planned lengths and the total holds by construction.
+
 Usage:
   make_shuffle_clips.py --logfile LOG --tmp-dir DIR [options] file1 file2 ...
 
 Outputs:
   • ${TMP_DIR}/clip_list.txt  (ffmpeg concat list)
+  • ${TMP_DIR}/plan.json      (clip plan + checkpoints for --resume)
   • N temporary clips inside  TMP_DIR/clipNN.mkv
+    (with --direct the list cuts the sources via inpoint/outpoint instead)
 """
 from __future__ import annotations
 import argparse
+import bisect
+import itertools
+import json
+import logging
 import math
 import random
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, NamedTuple, Sequence, cast
 
-from utils import setup_logging
+from utils import (
+    Timeline,
+    atomic_write_text,
+    probe_concurrently,
+    probe_durations,
+    probe_keyframes,
+    probe_start,
+    setup_logging,
+)
 
 TARGET_SEC = 600  # default total montage length
 MIN_CLIP = 2  # inclusive default
 MAX_CLIP = 5  # inclusive default
 PART_SCALE = 2  # same heuristic as your Bash: N ≈ 2*T/(MIN+MAX)
+KF_EPS = 1e-6  # ffprobe prints timestamps with microsecond precision
+STATE_FILE = "plan.json"  # saved plan + per‑clip checkpoints inside TMP_DIR
 
 
 def _parse_duration(value: str) -> int:
@@ -41,76 +63,137 @@ def _parse_duration(value: str) -> int:
         raise argparse.ArgumentTypeError(str(exc))
 
 
-def ffprobe_dur(path: Path) -> float:
-    out = subprocess.check_output(
+class Clip(NamedTuple):
+    """One planned cut: ``length`` seconds of ``src`` starting at ``start``."""
+
+    idx: int
+    src: Path
+    start: float
+    length: float
+    out: Path
+
+
+def _concat_quote(path: Path) -> str:
+    """Quote ``path`` for an ffmpeg concat manifest."""
+    return "'" + str(path).replace("'", "'\\''") + "'"
+
+
+def _extract_clip(src: Path, start: float, length: float, out: Path) -> None:
+    """Stream‑copy ``length`` seconds of ``src`` from ``start`` into ``out``."""
+    subprocess.run(
         [
-            "ffprobe",
-            "-v",
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel",
             "error",
-            "-select_streams",
-            "v:0",
-            "-show_entries",
-            "format=duration",
-            "-of",
-            "default=nw=1:nk=1",
-            str(path),
+            "-y",
+            "-ss",
+            f"{start:.6f}",
+            "-i",
+            str(src),
+            "-t",
+            f"{length:.6f}",
+            "-fflags",
+            "+genpts",
+            "-reset_timestamps",
+            "1",
+            "-video_track_timescale",
+            "90000",
+            "-c",
+            "copy",
+            "-movflags",
+            "+faststart",
+            str(out),
         ],
-        text=True,
+        check=True,
     )
-    return float(out.strip())
 
 
-def main() -> None:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--logfile", required=True)
-    ap.add_argument(
-        "--tmp-dir",
-        required=True,
-        help="scratch directory (created beforehand by the orchestrator)",
-    )
-    ap.add_argument("--target-sec", type=_parse_duration, default=TARGET_SEC)
-    ap.add_argument("--min-clip", type=_parse_duration, default=MIN_CLIP)
-    ap.add_argument("--max-clip", type=_parse_duration, default=MAX_CLIP)
-    ap.add_argument("--seed", type=int)
-    ap.add_argument("files", nargs="+")
-    ns = ap.parse_args()
+def _extract_group(clips: list[Clip]) -> None:
+    """
+    Cut every clip of one source file in a single ffmpeg run.
 
-    logger = setup_logging(ns.logfile, "shuffle-extract")
+    The source is opened and demuxed once and read front to back; each clip
+    is an output with its own ``-ss``/``-t`` window.  Planned windows start
+    on a key‑frame, so the copied clips match what an input seek would cut.
+    """
+    cmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-y",
+        "-fflags",
+        "+genpts",
+        "-i",
+        str(clips[0].src),
+    ]
+    for clip in clips:
+        cmd += [
+            "-ss",
+            f"{clip.start:.6f}",
+            "-t",
+            f"{clip.length:.6f}",
+            "-reset_timestamps",
+            "1",
+            "-video_track_timescale",
+            "90000",
+            "-c",
+            "copy",
+            "-movflags",
+            "+faststart",
+            str(clip.out),
+        ]
+    subprocess.run(cmd, check=True)
 
-    target_sec = ns.target_sec
-    min_clip = ns.min_clip
-    max_clip = ns.max_clip
-    if not (1 <= min_clip <= max_clip < target_sec):
-        logger.error("MIN_CLIP must be \u2264 MAX_CLIP and both < TARGET_SEC")
-        raise SystemExit(1)
 
-    rng = random.Random(ns.seed)
+def _extract(clips: list[Clip]) -> None:
+    """Extract a batch of clips (one source pass or a single cut)."""
+    if len(clips) > 1:
+        _extract_group(clips)
+    else:
+        clip = clips[0]
+        _extract_clip(clip.src, clip.start, clip.length, clip.out)
 
-    tmp_dir = Path(ns.tmp_dir)
-    try:
-        tmp_dir.mkdir(parents=True, exist_ok=True)
-        test_file = tmp_dir / ".write_test"
-        test_file.touch()
-        test_file.unlink()
-    except Exception:
-        logger.error("Cannot write to tmp-dir")
-        raise SystemExit(1)
 
-    files = [Path(f).resolve() for f in ns.files]
-    for f in files:
-        if not f.is_file():
-            logger.error(f"File not found: {f}")
-            raise SystemExit(1)
+def _keyframe_start(
+    point: float, lo: float, hi: float, keyframes: list[float]
+) -> float:
+    """
+    Pick the key‑frame a clip aimed at ``point`` should start on.
+
+    Prefer the last key‑frame in ``[lo, point]``, then the first in
+    ``(point, hi]``; only when the window holds none fall back to the one
+    before ``point``, or to ``point`` itself if there is none.  Without a
+    video stream every timestamp is a valid cut.
+    """
+    if not keyframes:
+        return point
+    i = bisect.bisect_right(keyframes, point + KF_EPS)
+    if i and keyframes[i - 1] >= lo - KF_EPS:
+        return keyframes[i - 1]
+    if i < len(keyframes) and keyframes[i] <= hi + KF_EPS:
+        return keyframes[i]
+    return keyframes[i - 1] if i else point
 
-    # ------------------------------------------------------------------ 1 ‑ durations & prefix sums
-    durations, prefix = [], [0.0]
+
+def _plan(
+    files: list[Path],
+    target_sec: int,
+    min_clip: int,
+    max_clip: int,
+    rng: random.Random,
+    tmp_dir: Path,
+    logger: logging.Logger,
+) -> list[Clip]:
+    """Probe the sources and lay out every clip on the combined timeline."""
+    # ------------------------------------------------------------------ 1 ‑ durations & timeline
     logger.info(f"{len(files)} source file(s) selected")
-    for f in files:
-        d = ffprobe_dur(f)
-        durations.append(d)
-        prefix.append(prefix[-1] + d)
+    durations = probe_durations(files)
+    for f, d in zip(files, durations):
         logger.info(f"{f.name:30s}  {d:8.2f}s")
-    combined = prefix[-1]
+    timeline = Timeline(durations)
+    combined = timeline.total
     logger.info(f"Combined timeline: {combined:.2f}s")
     if combined < target_sec:
         logger.error("source shorter than requested target")
@@ -137,107 +220,254 @@ def main() -> None:
     part_dur = combined / len(lengths)
     logger.info(f"Each virtual partition ≈{part_dur:.2f}s")
 
-    # ------------------------------------------------------------------ 3 ‑ extract
-    clip_list = tmp_dir / "clip_list.txt"
-    clip_list.write_text("", encoding="utf-8")
-
-    usable_total = 0.0
+    # ------------------------------------------------------------------ 3 ‑ plan clip sources
+    aims = []
     for idx, L in enumerate(lengths, 1):
         part_start = (idx - 1) * part_dur
         max_off = part_dur - L
         offset = rng.random() * max_off
-        global_start = part_start + offset
-
-        # locate which source video contains this timestamp
-        file_idx = next(
-            j
-            for j, p in enumerate(prefix[:-1])
-            if prefix[j] <= global_start < prefix[j + 1]
-        )
+        file_idx, local_start = timeline.locate(part_start + offset)
+        aims.append((idx, L, part_start, max_off, file_idx, local_start))
+
+    # index key-frames only around the seek points, in the files clips hit
+    points: dict[Path, list[float]] = {}
+    for *_, file_idx, local_start in aims:
+        points.setdefault(files[file_idx], []).append(local_start)
+    hit = list(points)
+    indexes = probe_concurrently(lambda f: probe_keyframes(f, points[f]), hit)
+    keyframes = dict(zip(hit, indexes))
+    logger.info(f"Key‑frame index ready ({len(hit)} of {len(files)} sources)")
+
+    plan: list[Clip] = []
+    for idx, L, part_start, max_off, file_idx, local_start in aims:
         src = files[file_idx]
-        local_start = global_start - prefix[file_idx]
-
-        out_clip = tmp_dir / f"clip{idx:03d}.mkv"
-        logger.info(
-            f"[{idx:03d}] {src.name:20s}  seek={local_start:7.2f}s  len={L:2d}s"
-        )
-
-        subprocess.run(
-            [
-                "ffmpeg",
-                "-hide_banner",
-                "-loglevel",
-                "error",
-                "-y",
-                "-ss",
-                f"{local_start:.6f}",
-                "-i",
-                str(src),
-                "-t",
-                str(L),
-                "-fflags",
-                "+genpts",
-                "-reset_timestamps",
-                "1",
-                "-video_track_timescale",
-                "90000",
-                "-c",
-                "copy",
-                "-movflags",
-                "+faststart",
-                str(out_clip),
-            ],
-            check=True,
-        )
-        real_len = ffprobe_dur(out_clip)
-        usable_total += real_len
-
-        if usable_total > target_sec + 0.0001:  # overshoot → trim last clip
-            excess = usable_total - target_sec
-            new_len = real_len - excess
-            if new_len < min_clip:  # drop it
-                out_clip.unlink()
-                break
-
-            subprocess.run(
-                [
-                    "ffmpeg",
-                    "-hide_banner",
-                    "-loglevel",
-                    "error",
-                    "-y",
-                    "-ss",
-                    f"{local_start:.6f}",
-                    "-i",
-                    str(src),
-                    "-t",
-                    f"{new_len:.6f}",
-                    "-fflags",
-                    "+genpts",
-                    "-reset_timestamps",
-                    "1",
-                    "-video_track_timescale",
-                    "90000",
-                    "-c",
-                    "copy",
-                    "-movflags",
-                    "+faststart",
-                    str(out_clip),
-                ],
-                check=True,
-            )
-            usable_total = target_sec
-            logger.info(
-                f"Trimmed last clip to {new_len:.2f}s to hit exactly {target_sec}s"
-            )
-            with clip_list.open("a", encoding="utf-8") as fh:
-                fh.write(f"file '{out_clip}'\n")
-            break
-        with clip_list.open("a", encoding="utf-8") as fh:
-            fh.write(f"file '{out_clip}'\n")
+        file_start = timeline.starts[file_idx]
+
+        # start on a real key‑frame inside the partition, so stream copy cuts
+        # exactly what we plan
+        win_lo = max(0.0, part_start - file_start)
+        win_hi = part_start + max_off - file_start
+        start = _keyframe_start(local_start, win_lo, win_hi, keyframes[src])
+
+        logger.info(f"[{idx:03d}] {src.name:20s}  seek={start:7.2f}s  len={L:2d}s")
+        pieces = timeline.spans(file_start + start, L)
+        for n, (j, piece_start, piece_len) in enumerate(pieces, 1):
+            name = f"clip{idx:03d}.mkv" if n == 1 else f"clip{idx:03d}_{n}.mkv"
+            if n > 1:  # a clip crossing a file boundary continues at the next start
+                logger.info(
+                    f"[{idx:03d}] continues in {files[j].name} ({piece_len:.2f}s)"
+                )
+            plan.append(Clip(idx, files[j], piece_start, piece_len, tmp_dir / name))
+        if sum(p[2] for p in pieces) < L - 1e-6:
+            logger.warning(f"[{idx:03d}] timeline ends early, clip cut short")
+    return plan
+
+
+def _load_state(path: Path) -> dict[str, Any] | None:
+    """Saved plan and per‑clip completion record, if a usable one exists."""
+    try:
+        return cast(dict[str, Any], json.loads(path.read_text(encoding="utf-8")))
+    except (OSError, ValueError):
+        return None
+
+
+def _is_done(clip: Clip, done: dict[str, Any]) -> bool:
+    """
+    True when ``clip`` was extracted before and is still intact on disk.
+
+    A checkpoint is written only after ffmpeg succeeded, so an unchanged
+    size and mtime are the whole test; the clip is not probed again.
+    """
+    rec = done.get(clip.out.name)
+    if rec is None:
+        return False
+    try:
+        st = clip.out.stat()
+    except OSError:
+        return False
+    return bool(st.st_size == rec["size"] and st.st_mtime_ns == rec["mtime_ns"])
+
+
+def run(
+    sources: Sequence[str | Path],
+    tmp_dir: str | Path,
+    *,
+    logger: logging.Logger,
+    target_sec: int = TARGET_SEC,
+    min_clip: int = MIN_CLIP,
+    max_clip: int = MAX_CLIP,
+    seed: int | None = None,
+    jobs: int = 1,
+    engine: str = "clip",
+    direct: bool = False,
+    resume: bool = False,
+) -> Path:
+    """Plan and cut the montage clips; return the path of ``clip_list.txt``."""
+
+    if not (1 <= min_clip <= max_clip < target_sec):
+        logger.error("MIN_CLIP must be \u2264 MAX_CLIP and both < TARGET_SEC")
+        raise SystemExit(1)
+
+    rng = random.Random(seed)
+
+    tmp_dir = Path(tmp_dir)
+    try:
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        test_file = tmp_dir / ".write_test"
+        test_file.touch()
+        test_file.unlink()
+    except Exception:
+        logger.error("Cannot write to tmp-dir")
+        raise SystemExit(1)
+
+    files = [Path(f).resolve() for f in sources]
+    for f in files:
+        if not f.is_file():
+            logger.error(f"File not found: {f}")
+            raise SystemExit(1)
+
+    state_path = tmp_dir / STATE_FILE
+    settings = {
+        "files": [str(f) for f in files],
+        "target_sec": target_sec,
+        "min_clip": min_clip,
+        "max_clip": max_clip,
+    }
+    state = _load_state(state_path) if resume else None
+    if state is not None and state["settings"] != settings:
+        logger.error("Saved plan does not match these arguments; drop --resume")
+        raise SystemExit(1)
+    if state is not None:
+        plan = [
+            Clip(c["idx"], Path(c["src"]), c["start"], c["length"], Path(c["out"]))
+            for c in state["clips"]
+        ]
+        done: dict[str, Any] = state["done"]
+        logger.info(f"Resuming saved plan from {state_path}")
+    else:
+        if resume:
+            logger.warning(f"No saved plan in {tmp_dir}, planning afresh")
+        plan = _plan(files, target_sec, min_clip, max_clip, rng, tmp_dir, logger)
+        done = {}
+    state = {
+        "settings": settings,
+        "clips": [{**c._asdict(), "src": str(c.src), "out": str(c.out)} for c in plan],
+        "done": done,
+    }
+    atomic_write_text(state_path, json.dumps(state, indent=1))
+
+    usable_total = sum(clip.length for clip in plan)
+
+    clip_list = tmp_dir / "clip_list.txt"
+    if direct:
+        # ------------------------------------------------------------------ 4 ‑ direct manifest
+        # the plan counts from each file's start; inpoint/outpoint are read
+        # as the file's own timestamps
+        lines = []
+        for clip in plan:
+            origin = probe_start(clip.src)
+            lines += [
+                f"file {_concat_quote(clip.src)}",
+                f"inpoint {origin + clip.start:.6f}",
+                f"outpoint {origin + clip.start + clip.length:.6f}",
+            ]
+        atomic_write_text(clip_list, "\n".join(lines) + "\n")
+        logger.info("Direct mode: manifest cuts the sources, no clips written")
+        logger.info(f"Usable media total: {usable_total:.2f}s")
+        logger.info("Clip list ready")
+        return clip_list
+
+    # ------------------------------------------------------------------ 4 ‑ extract
+    clip_list.unlink(missing_ok=True)  # no stale manifest while clips are cut
+
+    todo = [clip for clip in plan if not _is_done(clip, done)]
+    if len(todo) < len(plan):
+        logger.info(f"{len(plan) - len(todo)} clip(s) already extracted and intact")
+
+    if engine == "source":
+        batches = [list(g) for _, g in itertools.groupby(todo, key=lambda c: c.src)]
+        logger.info(f"Extracting {len(todo)} clips in {len(batches)} source pass(es)")
+    else:
+        batches = [[clip] for clip in todo]
+
+    jobs = max(1, jobs)
+    if jobs > 1:
+        logger.info(f"Extracting with {jobs} parallel jobs")
+
+    lock = threading.Lock()
+
+    def extract_and_record(batch: list[Clip]) -> None:
+        _extract(batch)
+        with lock:  # checkpoint right away so a crash loses no finished work
+            for clip in batch:
+                st = clip.out.stat()
+                done[clip.out.name] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            atomic_write_text(state_path, json.dumps(state, indent=1))
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        list(pool.map(extract_and_record, batches))
+
+    # one atomic write from the plan: concat never sees a half‑written list
+    atomic_write_text(
+        clip_list, "".join(f"file {_concat_quote(clip.out)}\n" for clip in plan)
+    )
 
     logger.info(f"Usable media total: {usable_total:.2f}s")
     logger.info("Clip list ready")
+    return clip_list
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--logfile", required=True)
+    ap.add_argument(
+        "--tmp-dir",
+        required=True,
+        help="scratch directory (created beforehand by the orchestrator)",
+    )
+    ap.add_argument("--target-sec", type=_parse_duration, default=TARGET_SEC)
+    ap.add_argument("--min-clip", type=_parse_duration, default=MIN_CLIP)
+    ap.add_argument("--max-clip", type=_parse_duration, default=MAX_CLIP)
+    ap.add_argument("--seed", type=int)
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of clips extracted concurrently (default 1)",
+    )
+    ap.add_argument(
+        "--engine",
+        choices=("clip", "source"),
+        default="clip",
+        help="one ffmpeg per clip, or one per source file cutting all its clips",
+    )
+    ap.add_argument(
+        "--direct",
+        action="store_true",
+        help="write inpoint/outpoint entries against the sources, no clip files",
+    )
+    ap.add_argument(
+        "--resume",
+        action="store_true",
+        help="reuse the plan saved in --tmp-dir and cut only missing clips",
+    )
+    ap.add_argument("files", nargs="+")
+    ns = ap.parse_args()
+
+    logger = setup_logging(ns.logfile, "shuffle-extract")
+    run(
+        ns.files,
+        ns.tmp_dir,
+        logger=logger,
+        target_sec=ns.target_sec,
+        min_clip=ns.min_clip,
+        max_clip=ns.max_clip,
+        seed=ns.seed,
+        jobs=ns.jobs,
+        engine=ns.engine,
+        direct=ns.direct,
+        resume=ns.resume,
+    )
 
 
 if __name__ == "__main__":
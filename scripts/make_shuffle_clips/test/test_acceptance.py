@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import json
 import os
 import shutil
 import subprocess
@@ -18,16 +19,29 @@ def make_dummy_ffmpeg(dir: Path) -> None:
         """#!/usr/bin/env python3
 import sys, pathlib, re
 args = sys.argv[1:]
-out = args[-1]
+flags = {'-y', '-hide_banner', '-nostdin', '-copyinkf'}
 length = 1.0
-for i, a in enumerate(args):
-    if a == '-t' and i + 1 < len(args):
-        length = float(args[i+1])
-    elif 'testsrc=duration=' in a:
-        m = re.search(r'duration=([0-9.]+)', a)
-        if m:
-            length = float(m.group(1))
-pathlib.Path(out).write_text(str(length))
+outs = []
+i = 0
+while i < len(args):
+    a = args[i]
+    if a in flags:
+        i += 1
+        continue
+    if a.startswith('-'):
+        val = args[i+1] if i + 1 < len(args) else ''
+        if a == '-t':
+            length = float(val)
+        elif 'testsrc=duration=' in val:
+            m = re.search(r'duration=([0-9.]+)', val)
+            if m:
+                length = float(m.group(1))
+        i += 2
+        continue
+    outs.append((a, length))
+    i += 1
+for out, length in outs:
+    pathlib.Path(out).write_text(str(length))
 if '-c' in args:
     idx = args.index('-c')
     if idx + 1 < len(args) and args[idx+1] == 'copy':
@@ -37,17 +51,57 @@ if '-c' in args:
     exe.chmod(0o755)
 
 
-def make_dummy_ffprobe(dir: Path, dur: float | None = None) -> None:
+def count_ffmpeg_calls(dir: Path, calls: Path, hook: str = "") -> None:
+    """Wrap the fake ffmpeg in ``dir`` so every run appends a line to ``calls``.
+
+    ``hook`` is shell run after the count, before the real fake is exec'd.
+    """
+    wrapper = dir / "ffmpeg"
+    real = dir / "ffmpeg_impl"
+    wrapper.rename(real)
+    wrapper.write_text(f'#!/bin/sh\necho x >> "{calls}"\n{hook}exec "{real}" "$@"\n')
+    wrapper.chmod(0o755)
+
+
+def make_dummy_ffprobe(
+    dir: Path,
+    dur: float | None = None,
+    gop: float | None = None,
+    start: float = 0.0,
+) -> None:
     exe = dir / "ffprobe"
     if dur is None:
         exe.write_text(
-            """#!/usr/bin/env python3
-import sys, pathlib
-print(pathlib.Path(sys.argv[-1]).read_text().strip())
+            f"""#!/usr/bin/env python3
+import sys, pathlib, json
+packets = 'packet=pts_time,flags' in sys.argv
+with open(pathlib.Path(__file__).with_name('ffprobe.calls'), 'a') as fh:
+    fh.write(('kf ' if packets else '') + sys.argv[-1] + '\\n')
+dur = pathlib.Path(sys.argv[-1]).read_text().strip()
+gop = {gop!r}
+start = {start!r}
+windows = [(0.0, float('inf'))]
+if '-read_intervals' in sys.argv:
+    spec = sys.argv[sys.argv.index('-read_intervals') + 1]
+    windows = [tuple(map(float, w.split('%'))) for w in spec.split(',')]
+if '-of' in sys.argv and sys.argv[sys.argv.index('-of') + 1] == 'json':
+    print(json.dumps({{'format': {{'duration': dur, 'start_time': str(start)}},
+                      'streams': [{{'codec_type': 'video', 'codec_name': 'h264'}}]}}))
+elif packets and gop:
+    for i in range(int(float(dur) / gop) + 1):
+        t = start + i * gop
+        if any(lo <= t <= hi for lo, hi in windows):
+            print(f'{{t:.6f}},K_')
+else:
+    print(dur)
 """
         )
     else:
-        exe.write_text(f"#!/bin/sh\necho {dur}\n")
+        exe.write_text(
+            f"""#!/bin/sh
+echo '{{"format": {{"duration": "{dur}"}}, "streams": []}}'
+"""
+        )
     exe.chmod(0o755)
 
 
@@ -57,6 +111,7 @@ def run_script(
     script = Path(__file__).resolve().parents[1] / "make_shuffle_clips.py"
     env = os.environ.copy()
     env["PYTHONPATH"] = str(Path(__file__).resolve().parents[3])
+    env["XDG_CACHE_HOME"] = str(tmp_path / "cache")
     if env_extra:
         env.update(env_extra)
     return subprocess.run(
@@ -433,3 +488,423 @@ def test_s7_unwritable_tmp(tmp_path: Path) -> None:
     )
     assert proc.returncode != 0
     assert "tmp-dir" in proc.stderr or "Permission" in proc.stderr
+
+
+def test_s8_parallel_jobs_keep_order(tmp_path: Path) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    make_dummy_ffmpeg(fake_bin)
+    make_dummy_ffprobe(fake_bin)
+    env_path = f"{fake_bin}:{os.environ['PATH']}"
+    src = tmp_path / "src.mp4"
+    src.write_text("60.0")
+    manifests = []
+    for jobs in ("1", "4"):
+        log = tmp_path / f"shuffle{jobs}.log"
+        out_dir = tmp_path / f"tmp{jobs}"
+        out_dir.mkdir()
+        proc = run_script(
+            tmp_path,
+            "--logfile",
+            str(log),
+            "--tmp-dir",
+            str(out_dir),
+            "--target-sec",
+            "20",
+            "--min-clip",
+            "1",
+            "--max-clip",
+            "3",
+            "--seed",
+            "7",
+            "--jobs",
+            jobs,
+            str(src),
+            env_extra={"PATH": env_path},
+        )
+        assert proc.returncode == 0
+        assert "Usable media total: 20.00s" in log.read_text()
+        lines = (out_dir / "clip_list.txt").read_text().splitlines()
+        manifests.append([Path(ln.split("'")[1]).name for ln in lines])
+    assert manifests[0] == manifests[1]
+    assert manifests[0] == sorted(manifests[0])
+
+
+def test_s9_source_engine_one_pass_per_file(tmp_path: Path) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    make_dummy_ffmpeg(fake_bin)
+    make_dummy_ffprobe(fake_bin)
+    calls = tmp_path / "calls.txt"
+    count_ffmpeg_calls(fake_bin, calls)
+    env_path = f"{fake_bin}:{os.environ['PATH']}"
+    sources = [tmp_path / "a.mp4", tmp_path / "b.mp4"]
+    for src in sources:
+        src.write_text("30.0")
+    log = tmp_path / "shuffle.log"
+    out_dir = tmp_path / "tmp"
+    out_dir.mkdir()
+    proc = run_script(
+        tmp_path,
+        "--logfile",
+        str(log),
+        "--tmp-dir",
+        str(out_dir),
+        "--target-sec",
+        "20",
+        "--min-clip",
+        "1",
+        "--max-clip",
+        "3",
+        "--engine",
+        "source",
+        *map(str, sources),
+        env_extra={"PATH": env_path},
+    )
+    assert proc.returncode == 0
+    assert "Usable media total: 20.00s" in log.read_text()
+    assert len(calls.read_text().splitlines()) == 2
+    for line in (out_dir / "clip_list.txt").read_text().splitlines():
+        assert Path(line.split("'")[1]).is_file()
+
+
+def test_s10_probe_cache_reused(tmp_path: Path) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    make_dummy_ffmpeg(fake_bin)
+    make_dummy_ffprobe(fake_bin)
+    env_path = f"{fake_bin}:{os.environ['PATH']}"
+    src = tmp_path / "src.mp4"
+    src.write_text("60.0")
+    args = ["--target-sec", "10", "--min-clip", "1", "--max-clip", "2", str(src)]
+    out_dir = tmp_path / "tmp"
+    out_dir.mkdir()
+    proc = run_script(
+        tmp_path,
+        "--logfile",
+        str(tmp_path / "first.log"),
+        "--tmp-dir",
+        str(out_dir),
+        *args,
+        env_extra={"PATH": env_path},
+    )
+    assert proc.returncode == 0
+    cache = tmp_path / "cache" / "everyday-scripts" / "probe.jsonl"
+    assert str(src) in cache.read_text()
+    # a cache hit must not need ffprobe for the source any more
+    (fake_bin / "ffprobe").write_text("#!/bin/sh\necho 1\n")
+    proc = run_script(
+        tmp_path,
+        "--logfile",
+        str(tmp_path / "second.log"),
+        "--tmp-dir",
+        str(out_dir),
+        *args,
+        env_extra={"PATH": env_path},
+    )
+    assert proc.returncode == 0
+    assert "Combined timeline: 60.00s" in (tmp_path / "second.log").read_text()
+
+
+def test_s11_no_reprobe_of_clips(tmp_path: Path) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    make_dummy_ffmpeg(fake_bin)
+    make_dummy_ffprobe(fake_bin, gop=2.0)
+    env_path = f"{fake_bin}:{os.environ['PATH']}"
+    src = tmp_path / "src.mp4"
+    src.write_text("120.0")
+    log = tmp_path / "shuffle.log"
+    out_dir = tmp_path / "tmp"
+    out_dir.mkdir()
+    proc = run_script(
+        tmp_path,
+        "--logfile",
+        str(log),
+        "--tmp-dir",
+        str(out_dir),
+        "--target-sec",
+        "20",
+        "--min-clip",
+        "2",
+        "--max-clip",
+        "4",
+        "--seed",
+        "3",
+        str(src),
+        env_extra={"PATH": env_path},
+    )
+    assert proc.returncode == 0
+    probed = (fake_bin / "ffprobe.calls").read_text().splitlines()
+    assert probed == [str(src), f"kf {src}"]  # duration + key‑frame index only
+    assert "Usable media total:" in log.read_text()
+
+
+def test_s12_keyframe_planned_cuts(tmp_path: Path) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    make_dummy_ffmpeg(fake_bin)
+    make_dummy_ffprobe(fake_bin, gop=2.0)
+    calls = tmp_path / "calls.txt"
+    count_ffmpeg_calls(fake_bin, calls)
+    env_path = f"{fake_bin}:{os.environ['PATH']}"
+    src = tmp_path / "src.mp4"
+    src.write_text("120.0")
+    log = tmp_path / "shuffle.log"
+    out_dir = tmp_path / "tmp"
+    out_dir.mkdir()
+    proc = run_script(
+        tmp_path,
+        "--logfile",
+        str(log),
+        "--tmp-dir",
+        str(out_dir),
+        "--target-sec",
+        "20",
+        "--min-clip",
+        "2",
+        "--max-clip",
+        "4",
+        "--seed",
+        "3",
+        str(src),
+        env_extra={"PATH": env_path},
+    )
+    assert proc.returncode == 0
+    text = log.read_text()
+    assert "Usable media total: 20.00s" in text
+    assert "Trimmed" not in text
+    seeks = [
+        float(line.split("seek=", 1)[1].split("s", 1)[0])
+        for line in text.splitlines()
+        if "seek=" in line
+    ]
+    assert all(abs(s / 2 - round(s / 2)) < 1e-6 for s in seeks)
+    clips = (out_dir / "clip_list.txt").read_text().splitlines()
+    assert len(calls.read_text().splitlines()) == len(clips) == len(seeks)
+
+
+def test_s13_clip_spanning_files(tmp_path: Path) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    make_dummy_ffmpeg(fake_bin)
+    make_dummy_ffprobe(fake_bin)
+    env_path = f"{fake_bin}:{os.environ['PATH']}"
+    sources = [tmp_path / f"seg{i}.mp4" for i in range(4)]
+    for src in sources:
+        src.write_text("1.2")
+    log = tmp_path / "shuffle.log"
+    out_dir = tmp_path / "tmp"
+    out_dir.mkdir()
+    proc = run_script(
+        tmp_path,
+        "--logfile",
+        str(log),
+        "--tmp-dir",
+        str(out_dir),
+        "--target-sec",
+        "2",
+        "--min-clip",
+        "1",
+        "--max-clip",
+        "1",
+        "--seed",
+        "1",
+        *map(str, sources),
+        env_extra={"PATH": env_path},
+    )
+    assert proc.returncode == 0
+    text = log.read_text()
+    assert "continues in" in text
+    assert "Usable media total: 2.00s" in text
+    total = 0.0
+    for line in (out_dir / "clip_list.txt").read_text().splitlines():
+        total += float(Path(line.split("'")[1]).read_text())
+    assert abs(total - 2) < 1e-3
+
+
+def test_s14_direct_manifest(tmp_path: Path) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    (fake_bin / "ffmpeg").write_text("#!/bin/sh\nexit 1\n")  # must not run
+    (fake_bin / "ffmpeg").chmod(0o755)
+    make_dummy_ffprobe(fake_bin, gop=2.0)
+    env_path = f"{fake_bin}:{os.environ['PATH']}"
+    src = tmp_path / "it's.mp4"
+    src.write_text("120.0")
+    log = tmp_path / "shuffle.log"
+    out_dir = tmp_path / "tmp"
+    out_dir.mkdir()
+    proc = run_script(
+        tmp_path,
+        "--logfile",
+        str(log),
+        "--tmp-dir",
+        str(out_dir),
+        "--target-sec",
+        "20",
+        "--min-clip",
+        "2",
+        "--max-clip",
+        "4",
+        "--direct",
+        str(src),
+        env_extra={"PATH": env_path},
+    )
+    assert proc.returncode == 0
+    assert not list(out_dir.glob("*.mkv"))
+    lines = (out_dir / "clip_list.txt").read_text().splitlines()
+    assert lines[0] == "file '" + str(src).replace("'", "'\\''") + "'"
+    inpoints = [float(ln.split()[1]) for ln in lines if ln.startswith("inpoint")]
+    outpoints = [float(ln.split()[1]) for ln in lines if ln.startswith("outpoint")]
+    assert all(abs(i / 2 - round(i / 2)) < 1e-6 for i in inpoints)
+    assert abs(sum(o - i for i, o in zip(inpoints, outpoints)) - 20) < 1e-3
+
+
+def test_s15_resume_extracts_only_missing(tmp_path: Path) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    make_dummy_ffmpeg(fake_bin)
+    make_dummy_ffprobe(fake_bin)
+    calls = tmp_path / "calls.txt"
+    # the fourth cut dies, as if the drive was unplugged
+    count_ffmpeg_calls(
+        fake_bin,
+        calls,
+        f'[ "$(wc -l < "{calls}")" -eq 4 ] && [ ! -e "{tmp_path}/healed" ] && exit 1\n',
+    )
+    env_path = f"{fake_bin}:{os.environ['PATH']}"
+    src = tmp_path / "src.mp4"
+    src.write_text("60.0")
+    out_dir = tmp_path / "tmp"
+    out_dir.mkdir()
+    args = ["--target-sec", "10", "--min-clip", "1", "--max-clip", "2", str(src)]
+    proc = run_script(
+        tmp_path,
+        "--logfile",
+        str(tmp_path / "first.log"),
+        "--tmp-dir",
+        str(out_dir),
+        *args,
+        env_extra={"PATH": env_path},
+    )
+    assert proc.returncode != 0
+    assert not (out_dir / "clip_list.txt").exists()  # never half‑written
+    plan = json.loads((out_dir / "plan.json").read_text())
+    n_clips, n_done = len(plan["clips"]), len(plan["done"])
+    assert 3 <= n_done < n_clips
+    (tmp_path / "healed").touch()
+    calls.write_text("")
+    proc = run_script(
+        tmp_path,
+        "--logfile",
+        str(tmp_path / "second.log"),
+        "--tmp-dir",
+        str(out_dir),
+        "--resume",
+        *args,
+        env_extra={"PATH": env_path},
+    )
+    assert proc.returncode == 0
+    assert len(calls.read_text().splitlines()) == n_clips - n_done
+    lines = (out_dir / "clip_list.txt").read_text().splitlines()
+    assert len(lines) == n_clips
+    assert "Usable media total: 10.00s" in (tmp_path / "second.log").read_text()
+
+
+def test_s16_keyframes_relative_to_start(tmp_path: Path) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    make_dummy_ffmpeg(fake_bin)
+    make_dummy_ffprobe(fake_bin, gop=2.0, start=3600.5)  # e.g. an MTS segment
+    env_path = f"{fake_bin}:{os.environ['PATH']}"
+    src = tmp_path / "src.mts"
+    src.write_text("120.0")
+    args = [
+        "--target-sec",
+        "20",
+        "--min-clip",
+        "2",
+        "--max-clip",
+        "4",
+        "--seed",
+        "5",
+        str(src),
+    ]
+    log = tmp_path / "shuffle.log"
+    out_dir = tmp_path / "clips"
+    out_dir.mkdir()
+    proc = run_script(
+        tmp_path,
+        "--logfile",
+        str(log),
+        "--tmp-dir",
+        str(out_dir),
+        *args,
+        env_extra={"PATH": env_path},
+    )
+    assert proc.returncode == 0
+    starts = [
+        c["start"] for c in json.loads((out_dir / "plan.json").read_text())["clips"]
+    ]
+    assert all(0 <= s < 120 and abs(s / 2 - round(s / 2)) < 1e-6 for s in starts)
+
+    direct_dir = tmp_path / "direct"
+    direct_dir.mkdir()
+    proc = run_script(
+        tmp_path,
+        "--logfile",
+        str(log),
+        "--tmp-dir",
+        str(direct_dir),
+        "--direct",
+        *args,
+        env_extra={"PATH": env_path},
+    )
+    assert proc.returncode == 0
+    lines = (direct_dir / "clip_list.txt").read_text().splitlines()
+    inpoints = [float(ln.split()[1]) for ln in lines if ln.startswith("inpoint")]
+    assert [round(i - 3600.5, 6) for i in inpoints] == starts
+
+
+def test_s17_keyframes_indexed_only_where_clips_land(tmp_path: Path) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    make_dummy_ffmpeg(fake_bin)
+    make_dummy_ffprobe(fake_bin, gop=2.0)
+    env_path = f"{fake_bin}:{os.environ['PATH']}"
+    sources = [tmp_path / f"archive{i}.mp4" for i in range(6)]
+    for src in sources:
+        src.write_text("600.0")
+    log = tmp_path / "shuffle.log"
+    out_dir = tmp_path / "tmp"
+    out_dir.mkdir()
+    proc = run_script(
+        tmp_path,
+        "--logfile",
+        str(log),
+        "--tmp-dir",
+        str(out_dir),
+        "--target-sec",
+        "4",
+        "--min-clip",
+        "2",
+        "--max-clip",
+        "2",
+        "--seed",
+        "1",
+        *map(str, sources),
+        env_extra={"PATH": env_path},
+    )
+    assert proc.returncode == 0
+    probed = (fake_bin / "ffprobe.calls").read_text().splitlines()
+    indexed = {line[3:] for line in probed if line.startswith("kf ")}
+    assert 1 <= len(indexed) <= 2  # two clips, six sources
+    text = log.read_text()
+    assert f"Key‑frame index ready ({len(indexed)} of 6 sources)" in text
+    seeks = [
+        float(line.split("seek=", 1)[1].split("s", 1)[0])
+        for line in text.splitlines()
+        if "seek=" in line
+    ]
+    assert all(abs(s / 2 - round(s / 2)) < 1e-6 for s in seeks)
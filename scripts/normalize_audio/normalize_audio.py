@@ -3,36 +3,42 @@
 Second loudnorm pass – applies the measured values and writes the R128 file.
 
 Usage:
-    normalize_audio.py --logfile LOG --in-file IN --out-file OUT --target-i -16 --target-tp -1.5 --analysis-json METRICS.json
+    normalize_audio.py --logfile LOG --in-file IN --out-file OUT --target-i -16 --target-tp -1.5 --analysis-json METRICS.json [--pcm-in AUDIO.w64]
+
+``--pcm-in`` takes the high-passed intermediate written by
+``analyse_loudness.py --pcm-out``; the gain is applied to it directly and only
+the video stream (copied, not decoded) is taken from IN.
 """
 from __future__ import annotations
 import argparse
 import json
-import subprocess
-from utils import setup_logging
+from pathlib import Path
+from typing import Any
+from utils import StageLogger, run_streamed, setup_logging
 
 
-def main() -> None:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--logfile", required=True)
-    ap.add_argument("--in-file", required=True)
-    ap.add_argument("--out-file", required=True)
-    ap.add_argument("--target-i", type=float, default=-16.0)
-    ap.add_argument("--target-tp", type=float, default=-1.5)
-    ap.add_argument("--analysis-json", required=True)
-    ns = ap.parse_args()
-
-    logger = setup_logging(ns.logfile, "loudnorm-pass2")
-
-    m = json.loads(open(ns.analysis_json).read())
+def run(
+    in_file: str | Path,
+    out_file: str | Path,
+    metrics: dict[str, Any],
+    *,
+    logger: StageLogger,
+    target_i: float = -16.0,
+    target_tp: float = -1.5,
+    pcm_in: str | Path | None = None,
+) -> None:
+    """Apply pass-1 ``metrics`` to ``in_file`` and write ``out_file``."""
+    m = metrics
     for k in ("input_i", "input_tp", "input_lra", "input_thresh", "target_offset"):
         if k not in m or m[k] in ("", None):
             raise RuntimeError(f"Missing key in metrics: {k}")
 
-    logger.info(f"PASS 2 normalising → {ns.out_file}")
+    logger.info(f"PASS 2 normalising → {out_file}")
+    # The intermediate is already high-passed; don't filter it twice.
+    source = "[1:a]" if pcm_in else "[0:a]highpass=f=120,"
     filter_complex = (
-        "[0:a]highpass=f=120,"
-        f"loudnorm=I={ns.target_i}:TP={ns.target_tp}:LRA=11:"
+        f"{source}"
+        f"loudnorm=I={target_i}:TP={target_tp}:LRA=11:"
         f"measured_I={m['input_i']}:measured_TP={m['input_tp']}:"
         f"measured_LRA={m['input_lra']}:measured_thresh={m['input_thresh']}:"
         f"offset={m['target_offset']}:linear=true:print_format=summary,"
@@ -44,9 +50,11 @@ def main() -> None:
         "-hide_banner",
         "-loglevel",
         "verbose",
+        "-nostats",
         "-y",
         "-i",
-        ns.in_file,
+        str(in_file),
+        *(["-i", str(pcm_in)] if pcm_in else []),
         "-filter_complex",
         filter_complex,
         "-map",
@@ -59,11 +67,39 @@ def main() -> None:
         "aac",
         "-movflags",
         "+faststart",
-        ns.out_file,
+        str(out_file),
     ]
-    subprocess.run(cmd, check=True)
+    returncode = run_streamed(cmd, lambda line: logger.info("ffmpeg: %s", line))
+    if returncode != 0:
+        logger.error("FFmpeg exited with status %d", returncode)
+        raise SystemExit(returncode)
     logger.info("✓ done – file normalised and saved")
 
 
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--logfile", required=True)
+    ap.add_argument("--in-file", required=True)
+    ap.add_argument("--out-file", required=True)
+    ap.add_argument("--target-i", type=float, default=-16.0)
+    ap.add_argument("--target-tp", type=float, default=-1.5)
+    ap.add_argument("--analysis-json", required=True)
+    ap.add_argument("--pcm-in")
+    ns = ap.parse_args()
+
+    logger = setup_logging(ns.logfile, "loudnorm-pass2")
+
+    m = json.loads(open(ns.analysis_json).read())
+    run(
+        ns.in_file,
+        ns.out_file,
+        m,
+        logger=logger,
+        target_i=ns.target_i,
+        target_tp=ns.target_tp,
+        pcm_in=ns.pcm_in,
+    )
+
+
 if __name__ == "__main__":
     main()
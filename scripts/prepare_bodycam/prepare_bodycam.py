@@ -3,124 +3,535 @@
 Usage:
     prepare_bodycam.py --logfile LOG --build-dir DIR FILE [FILE ...]
 Outputs:
-    - Populates DIR with either original clips or AV1‑re‑encoded versions.
+    - Populates DIR with original clips and/or AV1‑re‑encoded versions:
+      clips that already fit their share of the disc are copied.
     - Prints nothing; errors raise.
+
+Options:
+    --jobs N           re-encode N clips at once, longest first
+    --threads T        SVT-AV1 threads per encode (``-svtav1-params lp=T``)
+    --complexity-scan  weight per-clip bitrates by a sampled CRF probe
+    --stage MODE       auto|reflink|hardlink|symlink|copy|none for clips that fit
+    --manifest FILE    write the /on/disc=/file list for create_iso --manifest
+
+``run(..., on_file=cb)`` calls ``cb(path)`` as soon as each output is complete,
+so a caller can start using it (e.g. add it to an ISO) while the rest are still
+being produced.
 """
 from __future__ import annotations
 
 import argparse
+import logging
 import math
+import os
 import shutil
 import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from utils import setup_logging
+from typing import Callable, NamedTuple, Sequence
+from utils import (
+    FFmpegProgress,
+    atomic_write_text,
+    graft_point,
+    probe_cache,
+    probe_concurrently,
+    probe_durations,
+    run_streamed,
+    setup_logging,
+)
 
 DISC_BYTES = 25_000_000_000  # target BD‑R size
 SAFETY_BYTES = 500 * 1024 * 1024  # keep ~500 MiB free
 ALLOW_BYTES = DISC_BYTES - SAFETY_BYTES
+AUDIO_KBPS = 28  # libopus -b:a below
+MIN_KBPS = 100  # below this an AV1 encode is not worth keeping
+SCAN_SAMPLES = 3  # complexity pre-scan: samples per file …
+SCAN_SECONDS = 4.0  # … of this length
+WEIGHT_RANGE = (0.5, 2.0)  # clamp for complexity bitrate weights
+STAGE_MODES = ("auto", "reflink", "hardlink", "symlink", "copy", "none")
+FICLONE = 0x40049409  # linux/fs.h _IOW(0x94, 9, int)
+COPY_BLOCK = 64 * 1024 * 1024  # bytes per copy_file_range/sendfile call
+PROGRESS_EVERY = 30.0  # seconds between aggregated encode progress lines
+
+
+def run(
+    sources: Sequence[str | Path],
+    build_dir: str | Path,
+    *,
+    logger: logging.Logger,
+    on_file: Callable[[Path], None] | None = None,
+    jobs: int = 1,
+    threads: int | None = None,
+    scan: bool = False,
+    stage: str = "auto",
+) -> list[tuple[str, Path]]:
+    """
+    Fill ``build_dir`` with the clips, re‑encoding only those that must
+    shrink for the set to fit (see :func:`_plan`).  ``scan`` weights the
+    bitrates by a quick complexity pre‑scan of each clip; ``stage`` picks
+    how copied clips get into ``build_dir`` (see :func:`_stage`) – ``none``
+    leaves them where they are.
+
+    Returns the ``(path on disc, file)`` manifest for ``create_iso``.
+
+    Re-encodes run ``jobs`` at a time with ``threads`` SVT-AV1 threads each
+    (default: CPU count / ``jobs`` when ``jobs`` > 1); ``on_file`` may then be
+    called from worker threads.
+    """
+    files = [Path(f) for f in sources]
+    if not files:
+        logger.error("❌ No input files.")
+        sys.exit(1)
+
+    build_dir = Path(build_dir)
+    build_dir.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Working dir: {build_dir}")
+
+    sizes = [f.stat().st_size for f in files]
+    if sum(sizes) <= ALLOW_BYTES:
+        plan = [Clip(src, 0.0, None) for src in files]
+    else:
+        durations = probe_durations(files)
+        weights = _complexity_weights(files, durations, logger) if scan else None
+        plan = _plan(files, sizes, durations, weights)
+    copies = [c for c in plan if c.kbps is None]
+    encodes = [c for c in plan if c.kbps is not None]
+    mode = "reencode" if encodes else "copy"
+    logger.info(
+        f"Disc‑fit decision: {mode.upper()} "
+        f"({len(copies)} copied, {len(encodes)} re‑encoded)"
+    )
+    if any(c.kbps is not None and c.kbps < MIN_KBPS for c in encodes):
+        logger.error(f"❌ Clips don't fit even at {MIN_KBPS} kbps.")
+        sys.exit(2)
+
+    manifest = []
+    methods: dict[str, int] = {}
+    for clip in copies:
+        if stage == "none":
+            dst = clip.src.resolve()
+        else:
+            dst = build_dir / clip.src.name
+            how = _stage(clip.src, dst, stage)
+            methods[how] = methods.get(how, 0) + 1
+        manifest.append((f"/{clip.src.name}", dst))
+        if on_file:
+            on_file(dst)
+    if methods:
+        logger.info(
+            "Staged " + ", ".join(f"{n} by {how}" for how, n in sorted(methods.items()))
+        )
+    if encodes:
+        _encode_all(
+            encodes,
+            build_dir,
+            logger=logger,
+            jobs=jobs,
+            threads=threads,
+            on_file=on_file,
+        )
+        outs = [_encoded(c.src, build_dir) for c in encodes]
+        manifest += [(f"/{out.name}", out) for out in outs]
+    return manifest
+
+
+def _encoded(src: Path, build_dir: Path) -> Path:
+    """Build-dir path of the AV1 re-encode of ``src``."""
+    return build_dir / f"{src.stem}_recompressed_av1.mp4"
+
+
+def _reflink(src: Path, dst: Path) -> None:
+    """Share ``src``'s extents with a new ``dst`` (btrfs/XFS/APFS clone)."""
+    if sys.platform == "darwin":
+        subprocess.run(["cp", "-c", "-p", str(src), str(dst)], check=True)
+        return
+    import fcntl
+
+    with open(src, "rb") as fin, open(dst, "xb") as fout:
+        try:
+            fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+        except OSError:
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def _copy(src: Path, dst: Path) -> None:
+    """Kernel-side copy in big blocks; plain ``copy2`` where that's missing."""
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        remaining = os.fstat(fin.fileno()).st_size
+        try:
+            while remaining > 0:
+                if hasattr(os, "copy_file_range"):
+                    n = os.copy_file_range(fin.fileno(), fout.fileno(), COPY_BLOCK)
+                else:
+                    n = os.sendfile(fout.fileno(), fin.fileno(), None, COPY_BLOCK)
+                if n == 0:
+                    break
+                remaining -= n
+        except OSError:
+            remaining = -1  # e.g. EXDEV on older kernels, ENOTSOCK on macOS
+    if remaining != 0:
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+
+
+def _stage(src: Path, dst: Path, how: str) -> str:
+    """
+    Put ``src`` into the build dir as ``dst`` and return the method used.
+
+    ``auto`` tries a reflink, then a hardlink, then a copy – the footage is
+    only ever read from the build dir, so sharing blocks or the inode with
+    the original is safe.  ``symlink`` leaves the data where it is;
+    create_iso follows links when mastering.  A ``dst`` that *is* ``src``
+    (build dir = source dir) raises :class:`shutil.SameFileError` rather
+    than being unlinked.
+    """
+    src = src.resolve()
+    if dst.exists() and os.path.samefile(src, dst):
+        if dst.parent.resolve() / dst.name == src:
+            raise shutil.SameFileError(f"{src} would be staged over itself")
+        # otherwise a link left by an earlier run; dropping it loses nothing
+    dst.unlink(missing_ok=True)
+    if how == "symlink":
+        dst.symlink_to(src)
+        return how
+    if how in ("auto", "reflink"):
+        try:
+            _reflink(src, dst)
+            return "reflink"
+        except (OSError, subprocess.CalledProcessError):
+            if how == "reflink":
+                raise
+    if how in ("auto", "hardlink"):
+        try:
+            dst.unlink(missing_ok=True)
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            if how == "hardlink":
+                raise
+    _copy(src, dst)
+    return "copy"
+
+
+class Clip(NamedTuple):
+    """One planned input: ``kbps`` is the video bitrate, or None to copy."""
+
+    src: Path
+    secs: float
+    kbps: int | None
+
+
+def _plan(
+    files: list[Path],
+    sizes: list[int],
+    durations: list[float],
+    weights: list[float] | None = None,
+) -> list[Clip]:
+    """
+    Decide per file whether to copy or re‑encode, and at what bitrate.
+
+    The space left after the copies is shared out over the re‑encoded files
+    only, in proportion to ``secs × weight``.  Any file whose source bitrate
+    is already within its share gains nothing from an encode, so it moves to
+    the copy set; that frees space for the rest, and the split is repeated
+    until no file moves.  Low‑bitrate (static) clips therefore stay
+    untouched and the heavy ones absorb the cut.
+    """
+    weights = weights or [1.0] * len(files)
+    encode = set(range(len(files)))
+    rate = 0.0
+    while encode:
+        copied = sum(sizes[i] for i in range(len(files)) if i not in encode)
+        budget = (ALLOW_BYTES - copied) * 8 / 1000
+        budget -= AUDIO_KBPS * sum(durations[i] for i in encode)
+        rate = budget / (sum(durations[i] * weights[i] for i in encode) or 1.0)
+        if rate <= 0:
+            break  # not even the audio fits; run() reports it
+        fits = {
+            i
+            for i in encode
+            if sizes[i] * 8 / 1000 <= (rate * weights[i] + AUDIO_KBPS) * durations[i]
+        }
+        if not fits:
+            break
+        encode -= fits
+    return [
+        Clip(src, secs, math.floor(rate * w) if i in encode else None)
+        for i, (src, secs, w) in enumerate(zip(files, durations, weights))
+    ]
 
 
-def get_duration(path: Path) -> float:
-    out = subprocess.check_output(
-        [
-            "ffprobe",
-            "-v",
-            "error",
-            "-show_entries",
-            "format=duration",
-            "-of",
-            "default=nw=1:nk=1",
-            str(path),
-        ],
-        text=True,
+def _scan_cmd(src: Path, start: float) -> list[str]:
+    """Fast low‑res constant‑quality encode of one sample, written to stdout."""
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-ss",
+        f"{start:.3f}",
+        "-t",
+        str(SCAN_SECONDS),
+        "-i",
+        str(src),
+        "-map",
+        "0:v:0",
+        "-vf",
+        "scale=-2:240",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "ultrafast",
+        "-crf",
+        "30",
+        "-f",
+        "matroska",
+        "pipe:1",
+    ]
+
+
+def _complexity(src: Path, secs: float) -> float:
+    """
+    kbit/s a constant‑quality encode of ``src`` needs, from ``SCAN_SAMPLES``
+    evenly spaced samples (cached in the probe cache with the duration).
+    """
+    cached = probe_cache.get(src)
+    if cached and "complexity" in cached:
+        return float(cached["complexity"])
+    span = min(SCAN_SECONDS, secs)
+    starts = [
+        max(0.0, secs * (k + 1) / (SCAN_SAMPLES + 1) - span / 2)
+        for k in range(SCAN_SAMPLES)
+    ]
+    size = sum(
+        len(subprocess.run(_scan_cmd(src, t), capture_output=True, check=True).stdout)
+        for t in starts
     )
-    return float(out.strip())
+    kbps = size * 8 / 1000 / (span * SCAN_SAMPLES or 1.0)
+    probe_cache.put(src, {"complexity": kbps})
+    return kbps
+
+
+def _complexity_weights(
+    files: list[Path], durations: list[float], logger: logging.Logger
+) -> list[float]:
+    """Per‑file bitrate weights relative to the duration‑weighted mean."""
+    logger.info("Complexity pre‑scan…")
+    secs = dict(zip(files, durations))
+    scores = probe_concurrently(lambda f: _complexity(f, secs[f]), files)
+    mean = sum(c * d for c, d in zip(scores, durations)) / (sum(durations) or 1.0)
+    lo, hi = WEIGHT_RANGE
+    weights = [min(hi, max(lo, c / mean)) if mean else 1.0 for c in scores]
+    for f, w in zip(files, weights):
+        logger.info(f"  {f.name}: weight {w:.2f}")
+    return weights
+
+
+def _encode_cmd(src: Path, out: Path, kbps: int, threads: int | None) -> list[str]:
+    """Return the AV1/Opus re-encode command for one clip."""
+    svt_params = "rc=1" + (f":lp={threads}" if threads else "")
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "warning",
+        "-nostats",
+        "-progress",
+        "pipe:1",
+        "-y",
+        "-i",
+        str(src),
+        "-map",
+        "0:v:0",
+        "-map",
+        "0:a:0",
+        "-c:v",
+        "libsvtav1",
+        "-b:v",
+        f"{kbps}k",
+        "-svtav1-params",
+        svt_params,
+        "-preset",
+        "5",
+        "-c:a",
+        "libopus",
+        "-b:a",
+        f"{AUDIO_KBPS}k",
+        "-vbr",
+        "on",
+        "-compression_level",
+        "10",
+        "-application",
+        "audio",
+        "-frame_duration",
+        "40",
+        "-ar",
+        "24000",
+        "-ac",
+        "1",
+        "-cutoff",
+        "12000",
+        "-c:s",
+        "copy",
+        "-c:d",
+        "copy",
+        str(out),
+    ]
+
+
+class _Stopped(Exception):
+    """Raised inside an encode that is abandoned because another one failed."""
+
+
+def _encode_all(
+    plan: list[Clip],
+    build_dir: Path,
+    *,
+    logger: logging.Logger,
+    jobs: int,
+    threads: int | None,
+    on_file: Callable[[Path], None] | None,
+) -> None:
+    """
+    Run the re-encodes in ``plan`` into ``build_dir`` on ``jobs``
+    workers, longest clip first so a long one never starts last and
+    stretches the makespan.  Each encode reports ``-progress`` through its
+    own pipe; the totals are logged every ``PROGRESS_EVERY`` seconds.
+    The first failure stops the encodes still running – their ffmpeg is
+    killed at its next output line – and those not yet started; once the
+    pool has drained it is re-raised.
+    """
+    if jobs > 1 and threads is None:
+        threads = max(1, (os.cpu_count() or 1) // jobs)
+    total = sum(c.secs for c in plan) or 1.0
+    encoded = {c.src: 0.0 for c in plan}
+    lock = threading.Lock()
+    stop = threading.Event()
+    failed: list[BaseException] = []
+    last_report = time.monotonic()
+    if jobs > 1:
+        logger.info(f"Encoding {jobs} clips at a time, lp={threads} each")
+
+    def report(force: bool = False) -> None:
+        nonlocal last_report
+        now = time.monotonic()
+        if not force and now - last_report < PROGRESS_EVERY:
+            return
+        last_report = now
+        done = sum(encoded.values())
+        logger.info(f"Progress: {done / total:.1%} of {total / 60:.1f} min encoded")
+
+    def encode(idx: int, clip: Clip) -> None:
+        if stop.is_set():  # queued behind a failure
+            raise _Stopped(clip.src.name)
+        try:
+            encode_one(idx, clip)
+        except BaseException as exc:
+            with lock:  # first failure only; the rest see ``stop``
+                if not stop.is_set():
+                    failed.append(exc)
+                    stop.set()
+            raise
+
+    def encode_one(idx: int, clip: Clip) -> None:
+        src, secs, kbps = clip.src, clip.secs, clip.kbps or 0
+        out = _encoded(src, build_dir)
+        logger.info(f"[{idx}/{len(plan)}] → {out.name} at {kbps} kbps")
+        progress = FFmpegProgress()
+
+        def on_line(line: str) -> None:
+            if stop.is_set():  # run_streamed kills ffmpeg on the way out
+                raise _Stopped(src.name)
+            block = progress.feed(line)
+            if block is None:
+                if not progress.matches(line):
+                    logger.warning(f"{src.name}: {line}")
+                return
+            with lock:
+                us = block.get("out_time_us", "")
+                if us.isdigit():
+                    encoded[src] = min(secs, int(us) / 1_000_000)
+                report()
+
+        cmd = _encode_cmd(src, out, kbps, threads)
+        returncode = run_streamed(cmd, on_line)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd)
+        with lock:
+            encoded[src] = secs
+        logger.info(f"✓ {out.name}")
+        if on_file and not stop.is_set():
+            on_file(out)
+
+    order = sorted(plan, key=lambda c: c.secs, reverse=True)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(encode, idx, c) for idx, c in enumerate(order, 1)]
+        try:
+            for fut in as_completed(futures):
+                fut.result()
+        except BaseException:
+            stop.set()
+            for fut in futures:
+                fut.cancel()
+            if not failed:
+                raise
+    if failed:
+        raise failed[0]
+    report(force=True)
 
 
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--logfile", required=True)
     ap.add_argument("--build-dir", required=True)
+    ap.add_argument(
+        "--jobs", type=int, default=1, help="clips re-encoded at once (default 1)"
+    )
+    ap.add_argument(
+        "--threads",
+        type=int,
+        help="SVT-AV1 threads per encode (lp=; default: CPU count / jobs)",
+    )
+    ap.add_argument(
+        "--complexity-scan",
+        action="store_true",
+        help="weight re-encode bitrates by a quick sampled complexity probe",
+    )
+    ap.add_argument(
+        "--stage",
+        choices=STAGE_MODES,
+        default="auto",
+        help="how clips that fit are put in the build dir (default: auto)",
+    )
+    ap.add_argument(
+        "--manifest", help="also write the /on/disc=/file list for create_iso"
+    )
     ap.add_argument("files", nargs="+")
     ns = ap.parse_args()
+    if ns.jobs < 1:
+        ap.error("--jobs must be at least 1")
+    if ns.threads is not None and ns.threads < 1:
+        ap.error("--threads must be at least 1")
 
     logger = setup_logging(ns.logfile, "prepare")
-
-    files = [Path(f) for f in ns.files]
-    if not files:
-        logger.error("❌ No input files.")
-        sys.exit(1)
-
-    build_dir = Path(ns.build_dir)
-    build_dir.mkdir(parents=True, exist_ok=True)
-    logger.info(f"Working dir: {build_dir}")
-
-    total_input = sum(f.stat().st_size for f in files)
-    mode = "copy" if total_input <= ALLOW_BYTES else "reencode"
-    logger.info(f"Disc‑fit decision: {mode.upper()}")
-
-    if mode == "copy":
-        for src in files:
-            dst = build_dir / src.name
-            shutil.copy2(src, dst, follow_symlinks=True)
-    else:
-        total_seconds = sum(get_duration(f) for f in files)
-        global_kbps = math.floor((ALLOW_BYTES * 8) / 1000 / total_seconds)
-        logger.info(f"Re‑encoding all clips at ~{global_kbps} kbps")
-
-        for idx, src in enumerate(files, 1):
-            base = src.stem
-            out = build_dir / f"{base}_recompressed_av1.mp4"
-            logger.info(f"[{idx}/{len(files)}] → {out.name}")
-            subprocess.run(
-                [
-                    "ffmpeg",
-                    "-hide_banner",
-                    "-loglevel",
-                    "warning",
-                    "-stats",
-                    "-y",
-                    "-i",
-                    str(src),
-                    "-map",
-                    "0:v:0",
-                    "-map",
-                    "0:a:0",
-                    "-c:v",
-                    "libsvtav1",
-                    "-b:v",
-                    f"{global_kbps}k",
-                    "-svtav1-params",
-                    "rc=1",
-                    "-preset",
-                    "5",
-                    "-c:a",
-                    "libopus",
-                    "-b:a",
-                    "28k",
-                    "-vbr",
-                    "on",
-                    "-compression_level",
-                    "10",
-                    "-application",
-                    "audio",
-                    "-frame_duration",
-                    "40",
-                    "-ar",
-                    "24000",
-                    "-ac",
-                    "1",
-                    "-cutoff",
-                    "12000",
-                    "-c:s",
-                    "copy",
-                    "-c:d",
-                    "copy",
-                    str(out),
-                ],
-                check=True,
-            )
+    manifest = run(
+        ns.files,
+        ns.build_dir,
+        logger=logger,
+        jobs=ns.jobs,
+        threads=ns.threads,
+        scan=ns.complexity_scan,
+        stage=ns.stage,
+    )
+    if ns.manifest:
+        atomic_write_text(
+            ns.manifest, "".join(graft_point(d, f) + "\n" for d, f in manifest)
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+import pytest
+
+from scripts.prepare_bodycam import prepare_bodycam as prep
+
+MB = 1_000_000
+
+
+def make_dummy_ffmpeg(dir: Path, calls: Path) -> None:
+    """
+    Encoder that logs ``<src> <svtav1-params>`` to ``calls`` and writes
+    ``-progress`` blocks: ``bad*`` fails after one, ``quiet*`` goes silent
+    for a second and then succeeds, ``busy*`` keeps reporting for 10 s and
+    anything else finishes at once.
+    """
+    exe = dir / "ffmpeg"
+    exe.write_text(
+        f"""#!/usr/bin/env python3
+import pathlib, sys, time
+args = sys.argv
+src = pathlib.Path(args[args.index('-i') + 1])
+with open({str(calls)!r}, 'a') as fh:
+    fh.write(f"{{src.name}} {{args[args.index('-svtav1-params') + 1]}}\\n")
+def block(us, state='continue'):
+    print(f'frame=1\\nout_time_us={{us}}\\nprogress={{state}}', flush=True)
+block(0)
+if src.name.startswith('bad'):
+    print('Error while encoding', flush=True)
+    sys.exit(1)
+if src.name.startswith('quiet'):
+    time.sleep(1)
+if src.name.startswith('busy'):
+    for n in range(200):
+        time.sleep(0.05)
+        block(n * 50000)
+pathlib.Path(args[-1]).write_text('av1')
+block(1000000, 'end')
+"""
+    )
+    exe.chmod(0o755)
+
+
+def make_logger(name: str) -> logging.Logger:
+    logger = logging.getLogger(f"prepare-test-{name}")
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def planned_bytes(plan: list[prep.Clip], sizes: list[int]) -> float:
+    """Copied bytes plus the video+audio bitrate budget of each re-encode."""
+    return sum(
+        size if c.kbps is None else (c.kbps + prep.AUDIO_KBPS) * c.secs * 1000 / 8
+        for c, size in zip(plan, sizes)
+    )
+
+
+def test_plan_moves_small_clips_to_copy_set(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(prep, "ALLOW_BYTES", 10 * MB)
+    files = [Path("static.mp4"), Path("walk.mp4"), Path("chase.mp4")]
+    sizes = [MB // 2, 20 * MB, 20 * MB]
+    durations = [100.0, 100.0, 100.0]
+    plan = prep._plan(files, sizes, durations)
+    assert [c.src for c in plan] == files
+    assert plan[0].kbps is None
+    # the static clip's bytes no longer count against the encodes' audio
+    assert plan[1].kbps == plan[2].kbps == 352
+    assert planned_bytes(plan, sizes) <= prep.ALLOW_BYTES
+
+
+def test_plan_stays_within_budget(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(prep, "ALLOW_BYTES", 50 * MB)
+    files = [Path(f"clip{i}.mp4") for i in range(6)]
+    sizes = [2 * MB, 30 * MB, 7 * MB, 45 * MB, MB, 18 * MB]
+    durations = [600.0, 450.0, 90.0, 1200.0, 300.0, 240.0]
+    weights = [1.0, 1.7, 0.6, 1.2, 0.5, 2.0]
+    for w in (None, weights):
+        plan = prep._plan(files, sizes, durations, w)
+        encodes = [c for c in plan if c.kbps is not None]
+        assert encodes
+        assert planned_bytes(plan, sizes) <= prep.ALLOW_BYTES
+
+
+def test_plan_splits_by_weight(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(prep, "ALLOW_BYTES", 10 * MB)
+    files = [Path("calm.mp4"), Path("busy.mp4")]
+    sizes = [40 * MB, 40 * MB]
+    plan = prep._plan(files, sizes, [100.0, 100.0], [0.5, 2.0])
+    calm, busy = (c.kbps or 0 for c in plan)
+    assert busy == pytest.approx(4 * calm, abs=4)
+    assert planned_bytes(plan, sizes) <= prep.ALLOW_BYTES
+
+
+def test_complexity_weights_are_clamped(monkeypatch: pytest.MonkeyPatch) -> None:
+    scores = [10.0, 100.0, 100.0, 100.0, 300.0]  # mean 122 kbps
+    monkeypatch.setattr(prep, "_complexity", lambda f, secs: scores[int(f.stem)])
+    files = [Path(f"{i}.mp4") for i in range(len(scores))]
+    weights = prep._complexity_weights(
+        files, [60.0] * len(files), make_logger("weights")
+    )
+    lo, hi = prep.WEIGHT_RANGE
+    assert weights[0] == lo
+    assert weights[1:4] == [pytest.approx(100 / 122)] * 3
+    assert weights[4] == hi
+
+
+def test_run_exits_when_clips_need_less_than_min_kbps(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(prep, "ALLOW_BYTES", MB)
+    srcs = []
+    for i in range(3):
+        src = tmp_path / f"long{i}.mp4"
+        with open(src, "wb") as fh:
+            fh.truncate(5 * MB)
+        srcs.append(src)
+    monkeypatch.setattr(prep, "probe_durations", lambda files: [3600.0] * len(files))
+
+    def no_encode(*args: object, **kwargs: object) -> None:
+        raise AssertionError("nothing should be encoded")
+
+    monkeypatch.setattr(prep, "_encode_all", no_encode)
+    with pytest.raises(SystemExit) as exc:
+        prep.run(srcs, tmp_path / "build", logger=make_logger("min-kbps"))
+    assert exc.value.code == 2
+    assert not list((tmp_path / "build").iterdir())
+
+
+def encode_all(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    plan: list[prep.Clip],
+    jobs: int,
+    on_file: list[Path],
+) -> list[str]:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir(exist_ok=True)
+    calls = tmp_path / "calls.txt"
+    make_dummy_ffmpeg(fake_bin, calls)
+    monkeypatch.setenv("PATH", f"{fake_bin}:{os.environ['PATH']}")
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    build = tmp_path / "build"
+    build.mkdir(exist_ok=True)
+    try:
+        prep._encode_all(
+            plan,
+            build,
+            logger=make_logger("encode"),
+            jobs=jobs,
+            threads=None,
+            on_file=on_file.append,
+        )
+    finally:
+        lines = calls.read_text().splitlines() if calls.exists() else []
+    return lines
+
+
+def test_encode_all_longest_first(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    plan = [
+        prep.Clip(tmp_path / f"{name}.mp4", secs, 500)
+        for name, secs in (("short", 30.0), ("long", 900.0), ("mid", 240.0))
+    ]
+    done: list[Path] = []
+    calls = encode_all(tmp_path, monkeypatch, plan, 1, done)
+    assert calls == ["long.mp4 rc=1", "mid.mp4 rc=1", "short.mp4 rc=1"]
+    build = tmp_path / "build"
+    assert done == [
+        prep._encoded(tmp_path / f"{n}.mp4", build) for n in ("long", "mid", "short")
+    ]
+    assert all(out.read_text() == "av1" for out in done)
+
+
+def test_encode_all_splits_threads_over_jobs(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    plan = [prep.Clip(tmp_path / f"c{i}.mp4", 60.0 + i, 500) for i in range(4)]
+    done: list[Path] = []
+    calls = encode_all(tmp_path, monkeypatch, plan, 2, done)
+    assert sorted(calls) == [f"c{i}.mp4 rc=1:lp=4" for i in range(4)]
+    assert len(done) == 4
+
+
+def test_encode_all_stops_on_first_failure(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    plan = [
+        prep.Clip(tmp_path / "bad.mp4", 900.0, 500),
+        prep.Clip(tmp_path / "busy.mp4", 800.0, 500),
+        prep.Clip(tmp_path / "quiet.mp4", 700.0, 500),
+        prep.Clip(tmp_path / "queued.mp4", 600.0, 500),
+    ]
+    done: list[Path] = []
+    start = time.monotonic()
+    with pytest.raises(subprocess.CalledProcessError):
+        encode_all(tmp_path, monkeypatch, plan, 3, done)
+    assert time.monotonic() - start < 5  # busy.mp4 would report for 10 s
+    calls = (tmp_path / "calls.txt").read_text()
+    assert "queued.mp4" not in calls
+    build = tmp_path / "build"
+    assert not prep._encoded(tmp_path / "busy.mp4", build).exists()
+    # quiet.mp4 exits cleanly after the failure, but isn't handed on
+    assert prep._encoded(tmp_path / "quiet.mp4", build).exists()
+    assert done == []
+
+
+def make_source(tmp_path: Path) -> Path:
+    src_dir = tmp_path / "card"
+    src_dir.mkdir()
+    src = src_dir / "clip.mp4"
+    src.write_bytes(b"footage" * 1000)
+    return src
+
+
+@pytest.mark.parametrize("how", prep.STAGE_MODES)  # type: ignore[misc]
+def test_stage_modes(tmp_path: Path, how: str) -> None:
+    src = make_source(tmp_path)
+    build = tmp_path / "build"
+    build.mkdir()
+    if how == "none":
+        manifest = prep.run([src], build, logger=make_logger("stage"), stage=how)
+        assert manifest == [("/clip.mp4", src.resolve())]
+        assert not list(build.iterdir())
+        return
+    dst = build / src.name
+    try:
+        used = prep._stage(src, dst, how)
+    except OSError:
+        assert how == "reflink"  # filesystem without clones
+        assert not dst.exists()
+        return
+    assert used == how or how == "auto"
+    assert dst.read_bytes() == src.read_bytes()
+    if used == "symlink":
+        assert dst.is_symlink() and dst.resolve() == src.resolve()
+    if used == "hardlink":
+        assert os.path.samefile(src, dst)
+    if used == "copy":
+        assert not os.path.samefile(src, dst)
+    # staging again over the previous run's link or copy is fine
+    assert prep._stage(src, dst, how) == used
+    assert src.read_bytes() == b"footage" * 1000
+
+
+@pytest.mark.parametrize("how", ["auto", "reflink", "hardlink", "symlink", "copy"])  # type: ignore[misc]
+def test_stage_refuses_to_stage_file_over_itself(tmp_path: Path, how: str) -> None:
+    src = make_source(tmp_path)
+    data = src.read_bytes()
+    with pytest.raises(shutil.SameFileError):
+        prep._stage(src, src.parent / src.name, how)
+    # also when the build dir only reaches the sources through a link
+    (tmp_path / "build").symlink_to(src.parent)
+    with pytest.raises(shutil.SameFileError):
+        prep._stage(src, tmp_path / "build" / src.name, how)
+    assert src.read_bytes() == data
@@ -1,23 +1,41 @@
 #!/usr/bin/env python3
 """
 Usage:
-    run_pipeline.py FILE [FILE ...]
-Creates a per‑run timestamp, log file, working dir, ISO name, and then runs:
-    1. prepare_bodycam.py
-    2. create_iso.py
-    3. burn_iso.py
+    run_pipeline.py [--pipelined | --stream] FILE [FILE ...]
+Creates a per‑run timestamp, log file, working dir, ISO name, and then runs
+the stages in‑process through their ``run`` functions:
+    1. prepare_bodycam
+    2. create_iso
+    3. burn_iso
     4. utils.cleanup
-All stderr/stdout from sub‑scripts is appended to the same log.
+All stages log through one logger into the same log.
+
+Clips that already fit are not copied: prepare_bodycam returns a manifest of
+(path on disc, file) pairs and create_iso grafts the originals straight into
+the image, so only re-encodes use the build dir.
+
+With ``--pipelined`` stages 1 and 2 overlap: every file prepare_bodycam
+finishes is appended to the ISO as a new xorriso session
+(``create_iso.IsoAppender``) while the next one is still being encoded, so the
+burn starts as soon as the last file is in.
+
+With ``--stream`` no image file is written at all: genisoimage's stdout is
+relayed through a RAM buffer into growisofs (``create_iso.image_stream`` →
+``burn_iso.run_stream``).
 """
 from __future__ import annotations
 
 import argparse
 import datetime
 import os
-import subprocess
-import sys
 import tempfile
 from pathlib import Path
+from scripts.burn_iso.burn_iso import run as burn_iso
+from scripts.burn_iso.burn_iso import run_stream as burn_stream
+from scripts.create_iso.create_iso import IsoAppender, image_stream
+from scripts.create_iso.create_iso import run as create_iso
+from scripts.prepare_bodycam.prepare_bodycam import STAGE_MODES
+from scripts.prepare_bodycam.prepare_bodycam import run as prepare_bodycam
 from utils import cleanup, setup_logging
 
 ROOT = Path("/Volumes/Sabrent Rocket XTRM-Q 2TB")
@@ -35,8 +53,43 @@ def local_ts(fmt: str) -> str:
 
 def main() -> None:
     ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="author the ISO incrementally while clips are prepared (xorriso)",
+    )
+    ap.add_argument(
+        "--stream",
+        action="store_true",
+        help="pipe the image straight into the burner; no .iso is written",
+    )
+    ap.add_argument(
+        "--burn-skip-verify",
+        dest="burn_verify",
+        action="store_false",
+        help="don't read the disc back after burning",
+    )
+    ap.add_argument("--prep-jobs", type=int, default=1, help="parallel re-encodes")
+    ap.add_argument("--prep-threads", type=int, help="SVT-AV1 threads per encode")
+    ap.add_argument(
+        "--prep-complexity-scan",
+        action="store_true",
+        help="weight re-encode bitrates by a sampled complexity probe",
+    )
+    ap.add_argument(
+        "--prep-stage",
+        choices=STAGE_MODES,
+        default="none",
+        help="how clips that fit are put in the build dir (default: not at all)",
+    )
     ap.add_argument("files", nargs="+")
     ns = ap.parse_args()
+    if ns.pipelined and ns.stream:
+        ap.error("--pipelined and --stream are alternatives")
+    if ns.prep_jobs < 1:
+        ap.error("--prep-jobs must be at least 1")
+    if ns.prep_threads is not None and ns.prep_threads < 1:
+        ap.error("--prep-threads must be at least 1")
     files = [Path(f) for f in ns.files]
 
     LOG_DIR.mkdir(parents=True, exist_ok=True)
@@ -53,37 +106,70 @@ def main() -> None:
     iso_ts = utc_ts("%Y%m%dT%H%M%SZ")
     iso_path = IMG_DIR / f"{iso_ts}.iso"
 
-    env = os.environ.copy()
-    env["PATH"] = "/opt/homebrew/bin:/usr/local/bin:" + env["PATH"]
-
-    scripts_root = Path(__file__).resolve().parents[1]
-
-    def run(script_name: str, *extra: str) -> None:
-        script_path = scripts_root / script_name / f"{script_name}.py"
-        subprocess.run(
-            [sys.executable, str(script_path), "--logfile", str(logfile), *extra],
-            env=env,
-            check=True,
+    os.environ["PATH"] = "/opt/homebrew/bin:/usr/local/bin:" + os.environ["PATH"]
+    logger = setup_logging(str(logfile), "bodycam")
+
+    if ns.pipelined:
+        appender = IsoAppender(iso_path, logger=logger, label=iso_ts)
+        try:
+            prepare_bodycam(
+                files,
+                build_dir,
+                logger=logger,
+                on_file=appender.add,
+                jobs=ns.prep_jobs,
+                threads=ns.prep_threads,
+                scan=ns.prep_complexity_scan,
+                stage=ns.prep_stage,
+            )
+        except BaseException:
+            appender.cancel()
+            raise
+        appender.finish()
+        burn_iso(iso_path, logger=logger, verify=ns.burn_verify)
+    elif ns.stream:
+        manifest = prepare_bodycam(
+            files,
+            build_dir,
+            logger=logger,
+            jobs=ns.prep_jobs,
+            threads=ns.prep_threads,
+            scan=ns.prep_complexity_scan,
+            stage=ns.prep_stage,
         )
+        with image_stream(None, logger=logger, label=iso_ts, manifest=manifest) as (
+            image,
+            sectors,
+            generator_status,
+        ):
+            burn_stream(
+                image,
+                logger=logger,
+                sectors=sectors,
+                verify=ns.burn_verify,
+                producer=generator_status,
+            )
+    else:
+        manifest = prepare_bodycam(
+            files,
+            build_dir,
+            logger=logger,
+            jobs=ns.prep_jobs,
+            threads=ns.prep_threads,
+            scan=ns.prep_complexity_scan,
+            stage=ns.prep_stage,
+        )
+        create_iso(None, iso_path, logger=logger, label=iso_ts, manifest=manifest)
+        burn_iso(iso_path, logger=logger, verify=ns.burn_verify)
 
-    run("prepare_bodycam", "--build-dir", str(build_dir), *map(str, files))
-    run(
-        "create_iso",
-        "--build-dir",
-        str(build_dir),
-        "--iso-path",
-        str(iso_path),
-        "--iso-ts",
-        iso_ts,
-    )
-    run("burn_iso", "--iso-path", str(iso_path))
-
-    logger = setup_logging(str(logfile), "cleanup")
     cleanup(build_dir, logger)
 
     # Summarise for the user
-    print("\n🎉  Done – ISO stored at:")
-    print(iso_path)
+    if ns.stream:
+        print(f"\n🎉  Done – disc {iso_ts} burned (no ISO kept)")
+    else:
+        print("\n🎉  Done – ISO stored at:")
+        print(iso_path)
     print(f"\nFull log → {logfile}")
 
 
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+import pytest
+
+from scripts.run_bodycam_pipeline import run_bodycam_pipeline as pipeline
+
+
+@pytest.mark.parametrize(  # type: ignore[misc]
+    "args, message",
+    [
+        (["--prep-jobs", "0"], "--prep-jobs must be at least 1"),
+        (["--prep-threads", "0"], "--prep-threads must be at least 1"),
+    ],
+)
+def test_rejects_bad_prep_counts(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+    args: list[str],
+    message: str,
+) -> None:
+    monkeypatch.setattr(pipeline, "LOG_DIR", tmp_path / "logs")
+    monkeypatch.setattr(
+        sys, "argv", ["run_bodycam_pipeline.py", *args, str(tmp_path / "a.mp4")]
+    )
+    with pytest.raises(SystemExit) as exc:
+        pipeline.main()
+    assert exc.value.code == 2
+    assert message in capsys.readouterr().err
+    assert not (tmp_path / "logs").exists()
@@ -4,19 +4,53 @@ High‑level wrapper that replicates `normalize_audio.sh`.
 
 Usage:
     run_audio_pipeline.py [-i LUFS] [-t TP] input [output]
+    run_audio_pipeline.py --batch [-j N] [--out-dir DIR] [-i LUFS] [-t TP] PATH...
+
+In batch mode every PATH is a media file or a directory of them; each file
+runs its own pass 1 → pass 2 chain on a worker pool, so one file's render
+overlaps the next file's analysis.  All stages, ffmpeg's output included,
+share one log in which every line is tagged with its file; it ends with a
+summary table.  Each running job holds a multi-GB ``.w64`` intermediate, so
+the pool defaults to at most ``DEFAULT_JOBS`` workers and the intermediates
+go to ``--out-dir`` when one is given.
+
+Both passes run in this process (``analyse_loudness.run`` /
+``normalize_audio.run``) and share one logger; only ffmpeg is spawned.
 """
 from __future__ import annotations
 import argparse
+import logging
 import os
 import subprocess
 import sys
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from scripts.analyse_loudness.analyse_loudness import run as analyse_loudness
+from scripts.normalize_audio.normalize_audio import run as normalize_audio
+from utils import StageLogger, TaggedLogger, setup_logging
 
 ROOT = Path("/Volumes/Sabrent Rocket XTRM-Q 2TB")
 LOG_DIR = ROOT / "logs"
 DEFAULT_I, DEFAULT_TP = -16.0, -1.5
+MEDIA_EXTS = {
+    ".aac",
+    ".aif",
+    ".aiff",
+    ".flac",
+    ".m4a",
+    ".mkv",
+    ".mov",
+    ".mp3",
+    ".mp4",
+    ".ogg",
+    ".opus",
+    ".wav",
+}
+OUT_SUFFIX = "_R128"
+DEFAULT_JOBS = min(4, os.cpu_count() or 1)  # each job holds a .w64 intermediate
 
 
 def utc_stamp(fmt: str = "%Y%m%dT%H%M%SZ") -> str:
@@ -27,6 +61,107 @@ def local_stamp(fmt: str = "%Y%m%dT%H%M%S") -> str:
     return datetime.now().strftime(fmt)
 
 
+def output_for(inp: Path, out_dir: Path | None = None) -> Path:
+    """``<stem>_R128<ext>`` next to the input, or in ``out_dir``."""
+    return (out_dir or inp.parent) / f"{inp.stem}{OUT_SUFFIX}{inp.suffix}"
+
+
+def expand_inputs(paths: list[str]) -> list[Path]:
+    """Files as given; directories contribute their media files (sorted),
+    skipping earlier ``*_R128`` results."""
+    found: list[Path] = []
+    for raw in paths:
+        p = Path(raw).expanduser().resolve()
+        if p.is_dir():
+            found += sorted(
+                f
+                for f in p.iterdir()
+                if f.is_file()
+                and f.suffix.lower() in MEDIA_EXTS
+                and not f.stem.endswith(OUT_SUFFIX)
+            )
+        else:
+            found.append(p)
+    return list(dict.fromkeys(found))
+
+
+def normalise(
+    inp: Path,
+    out: Path,
+    lufs: float,
+    tp: float,
+    logger: StageLogger,
+    scratch: Path | None = None,
+) -> None:
+    """Run pass 1 and pass 2 for one file in this process; the PCM
+    intermediate goes to ``scratch`` (default: the temp dir)."""
+    pcm = Path(tempfile.mktemp(prefix="loudnorm_", suffix=".w64", dir=scratch))
+    try:
+        # -- PASS 1 ---------------------------------------------------------
+        metrics = analyse_loudness(
+            inp, logger=logger, target_i=lufs, target_tp=tp, pcm_out=pcm
+        )
+        # -- PASS 2 ---------------------------------------------------------
+        normalize_audio(
+            inp, out, metrics, logger=logger, target_i=lufs, target_tp=tp, pcm_in=pcm
+        )
+    finally:
+        pcm.unlink(missing_ok=True)  # cleanup
+
+
+def run_batch(ns: argparse.Namespace, logger: logging.Logger) -> int:
+    """Normalise many files on a worker pool; return the number that failed."""
+    files = expand_inputs(ns.paths)
+    out_dir = Path(ns.out_dir).expanduser().resolve() if ns.out_dir else None
+    if out_dir:
+        out_dir.mkdir(parents=True, exist_ok=True)
+    jobs = [(inp, output_for(inp, out_dir)) for inp in files]
+    if not jobs:
+        logger.error("No media files found in %s", " ".join(ns.paths))
+        return 1
+
+    outs = [out for _, out in jobs]
+    clashes = {o for o in outs if outs.count(o) > 1}
+    if clashes:
+        logger.error("Several inputs map to %s", ", ".join(map(str, sorted(clashes))))
+        return len(jobs)
+    logger.info("Batch: %d file(s) on %d worker(s)", len(jobs), ns.jobs)
+
+    def one(job: tuple[Path, Path]) -> tuple[str, float]:
+        inp, out = job
+        flog = TaggedLogger(logger, inp.name)
+        started = time.monotonic()
+        if not inp.is_file():
+            status = "not found"
+        else:
+            try:
+                normalise(inp, out, ns.lufs, ns.tp, flog, scratch=out_dir)
+                status = "ok"
+            except SystemExit as exc:
+                status = f"failed ({exc.code})"
+            except subprocess.CalledProcessError as exc:
+                status = f"failed ({exc.returncode})"
+            except (OSError, RuntimeError) as exc:
+                flog.error("%s", exc)
+                status = "failed"
+        elapsed = time.monotonic() - started
+        flog.info("%s in %.1fs", status, elapsed)
+        return status, elapsed
+
+    with ThreadPoolExecutor(max_workers=ns.jobs) as pool:
+        results = list(pool.map(one, jobs))
+
+    width = max([len(inp.name) for inp, _ in jobs] + [4])
+    rows = [f"{'File':<{width}}  {'Status':<12}  {'Time':>8}  Output"]
+    for (inp, out), (status, elapsed) in zip(jobs, results):
+        shown = str(out) if status == "ok" else "-"
+        rows.append(f"{inp.name:<{width}}  {status:<12}  {elapsed:>7.1f}s  {shown}")
+    logger.info("Summary:\n%s", "\n".join(rows))
+    failed = sum(status != "ok" for status, _ in results)
+    logger.info("%d ok, %d failed", len(results) - failed, failed)
+    return failed
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument(
@@ -43,75 +178,52 @@ def main() -> None:
         default=DEFAULT_TP,
         help=f"Target true peak in dBTP (default {DEFAULT_TP})",
     )
-    ap.add_argument("input")
-    ap.add_argument("output", nargs="?")
+    ap.add_argument(
+        "--batch",
+        action="store_true",
+        help="treat every path as an input file or directory",
+    )
+    ap.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f"files processed at once in batch mode (default {DEFAULT_JOBS})",
+    )
+    ap.add_argument("--out-dir", help="batch mode: write results here")
+    ap.add_argument("paths", nargs="+", metavar="input")
     ns = ap.parse_args()
+    if ns.jobs < 1:
+        ap.error("--jobs must be at least 1")
+    if not ns.batch and (len(ns.paths) > 2 or ns.out_dir):
+        ap.error("several inputs or --out-dir need --batch")
 
-    inp = Path(ns.input).expanduser().resolve()
-    if not inp.exists():
-        sys.exit(f"❌ not found: {inp}")
+    if not ns.batch:
+        inp = Path(ns.paths[0]).expanduser().resolve()
+        if not inp.exists():
+            sys.exit(f"❌ not found: {inp}")
 
-    if ns.output:
-        out = Path(ns.output).expanduser().resolve()
-    else:
-        out = inp.with_name(f"{inp.stem}_R128{inp.suffix}")
+        if len(ns.paths) > 1:
+            out = Path(ns.paths[1]).expanduser().resolve()
+        else:
+            out = output_for(inp)
 
-    if out == inp:
-        sys.exit("❌ refusing to overwrite input")
+        if out == inp:
+            sys.exit("❌ refusing to overwrite input")
 
     LOG_DIR.mkdir(parents=True, exist_ok=True)
     log = LOG_DIR / f"Audio-Normalise-{local_stamp()}.log"
     log.touch()
 
-    metrics = Path(tempfile.mktemp(prefix="loudnorm_", suffix=".json"))
-
-    env = os.environ.copy()
-    env["PATH"] = "/opt/homebrew/bin:/usr/local/bin:" + env["PATH"]
-
-    scripts_root = Path(__file__).resolve().parents[1]
-
-    def run(cmd: list[str]) -> None:
-        subprocess.run(cmd, env=env, check=True)
-
-    # -- PASS 1 -------------------------------------------------------------
-    run(
-        [
-            sys.executable,
-            str(scripts_root / "analyse_loudness" / "analyse_loudness.py"),
-            "--logfile",
-            str(log),
-            "--in-file",
-            str(inp),
-            "--target-i",
-            str(ns.lufs),
-            "--target-tp",
-            str(ns.tp),
-            "--out-json",
-            str(metrics),
-        ]
-    )
+    os.environ["PATH"] = "/opt/homebrew/bin:/usr/local/bin:" + os.environ["PATH"]
+    logger = setup_logging(str(log), "normalize")
 
-    # -- PASS 2 -------------------------------------------------------------
-    run(
-        [
-            sys.executable,
-            str(scripts_root / "normalize_audio" / "normalize_audio.py"),
-            "--logfile",
-            str(log),
-            "--in-file",
-            str(inp),
-            "--out-file",
-            str(out),
-            "--target-i",
-            str(ns.lufs),
-            "--target-tp",
-            str(ns.tp),
-            "--analysis-json",
-            str(metrics),
-        ]
-    )
+    if ns.batch:
+        failed = run_batch(ns, logger)
+        print(f"\nFull log → {log}")
+        raise SystemExit(1 if failed else 0)
 
-    metrics.unlink(missing_ok=True)  # cleanup
+    normalise(inp, out, ns.lufs, ns.tp, logger)
     print(f"\n🎉  Done – normalised file saved to:\n{out}")
     print(f"\nFull log → {log}")
 
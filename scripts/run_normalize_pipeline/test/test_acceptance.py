@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+import pytest
+
+from scripts.run_normalize_pipeline import run_normalize_pipeline as pipeline
+
+METRICS = {
+    "input_i": "-20.00",
+    "input_tp": "-3.00",
+    "input_lra": "5.00",
+    "input_thresh": "-30.00",
+    "target_offset": "0.00",
+}
+
+
+def fake_analyse(inp: Path, *, logger: Any, pcm_out: Path, **_: Any) -> dict[str, str]:
+    logger.info("ffmpeg: measured")
+    Path(pcm_out).write_bytes(b"pcm")
+    return dict(METRICS)
+
+
+def make_dummy_ffmpeg(dir: Path) -> None:
+    """Pass-2 ffmpeg: chatty, and fails on any input named ``bad*``."""
+    exe = dir / "ffmpeg"
+    exe.write_text(
+        """#!/usr/bin/env python3
+import sys, pathlib
+src = sys.argv[sys.argv.index('-i') + 1]
+print('[aac @ 0x1] using cpu capabilities', file=sys.stderr)
+if pathlib.Path(src).name.startswith('bad'):
+    print(f'{src}: Invalid data found when processing input', file=sys.stderr)
+    sys.exit(3)
+pathlib.Path(sys.argv[-1]).write_text('normalised')
+"""
+    )
+    exe.chmod(0o755)
+
+
+def run_main(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, *argv: str
+) -> tuple[int, str]:
+    log_dir = tmp_path / "logs"
+    monkeypatch.setenv("PATH", os.environ["PATH"])  # main() prepends to it
+    monkeypatch.setattr(pipeline, "LOG_DIR", log_dir)
+    monkeypatch.setattr(pipeline, "analyse_loudness", fake_analyse)
+
+    def file_logger(path: str, name: str) -> logging.Logger:
+        logger = logging.getLogger(f"normalize-test-{path}")
+        logger.handlers.clear()
+        logger.addHandler(logging.FileHandler(path))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        return logger
+
+    monkeypatch.setattr(pipeline, "setup_logging", file_logger)
+    monkeypatch.setattr(sys, "argv", ["run_normalize_pipeline.py", *argv])
+    with pytest.raises(SystemExit) as exc:
+        pipeline.main()
+    (log,) = log_dir.glob("*.log")
+    return int(exc.value.code or 0), log.read_text()
+
+
+def test_expand_inputs(tmp_path: Path) -> None:
+    stems = tmp_path / "stems"
+    stems.mkdir()
+    for name in ("b.wav", "a.mp3", "notes.txt", "a_R128.mp3"):
+        (stems / name).write_text("x")
+    extra = tmp_path / "extra.WAV"
+    extra.write_text("x")
+    found = pipeline.expand_inputs([str(stems), str(extra), str(stems / "b.wav")])
+    assert found == [stems / "a.mp3", stems / "b.wav", extra]
+
+
+def test_batch_logs_each_file_and_reports_failures(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    make_dummy_ffmpeg(fake_bin)
+    monkeypatch.setenv("PATH", f"{fake_bin}:{os.environ['PATH']}")
+    stems = tmp_path / "stems"
+    stems.mkdir()
+    for name in ("good.wav", "bad.wav"):
+        (stems / name).write_text("x")
+    out_dir = tmp_path / "done"
+    code, log = run_main(
+        tmp_path,
+        monkeypatch,
+        "--batch",
+        "-j",
+        "2",
+        "--out-dir",
+        str(out_dir),
+        str(stems),
+    )
+    assert code == 1
+    assert (out_dir / "good_R128.wav").read_text() == "normalised"
+    assert not (out_dir / "bad_R128.wav").exists()
+    assert not list(out_dir.glob("*.w64"))  # intermediates lived here, then went
+    assert "[bad.wav] ffmpeg: " in log and "Invalid data found" in log
+    assert "[bad.wav] FFmpeg exited with status 3" in log
+    assert "[good.wav] ffmpeg: measured" in log
+    summary = log.split("Summary:", 1)[1]
+    assert "bad.wav" in summary and "failed (3)" in summary
+    assert "1 ok, 1 failed" in log
+
+
+def test_batch_refuses_output_clash(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    for sub in ("one", "two"):
+        (tmp_path / sub).mkdir()
+        (tmp_path / sub / "take.wav").write_text("x")
+    code, log = run_main(
+        tmp_path,
+        monkeypatch,
+        "--batch",
+        "--out-dir",
+        str(tmp_path / "done"),
+        str(tmp_path / "one" / "take.wav"),
+        str(tmp_path / "two" / "take.wav"),
+    )
+    assert code == 1
+    assert "Several inputs map to" in log
+    assert not list((tmp_path / "done").iterdir())
+
+
+def test_batch_all_ok_exits_zero(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    make_dummy_ffmpeg(fake_bin)
+    monkeypatch.setenv("PATH", f"{fake_bin}:{os.environ['PATH']}")
+    src = tmp_path / "take.wav"
+    src.write_text("x")
+    code, log = run_main(tmp_path, monkeypatch, "--batch", str(src))
+    assert code == 0
+    assert (tmp_path / "take_R128.wav").is_file()
+    assert "1 ok, 0 failed" in log
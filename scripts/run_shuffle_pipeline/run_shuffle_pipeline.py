@@ -1,17 +1,30 @@
 #!/usr/bin/env python3
 """
 Usage:
-    run_shuffle_pipeline.py clip1 clip2 ...
-
-Creates a 10‑minute random shuffle montage on the Desktop.
+    run_shuffle_pipeline.py [--target-sec N] [--min-clip N] [--max-clip N]
+                            [--seed N] [--jobs N] [--engine clip|source]
+                            [--direct] [--tmp-dir DIR [--resume]]
+                            clip1 clip2 ...
+
+Creates a 10‑minute random shuffle montage on the Desktop.  With --direct the
+montage is cut straight from the sources, without temporary clip files.  The
+extraction options are passed through to make_shuffle_clips unchanged.
 """
 from __future__ import annotations
+import argparse
 import os
-import subprocess
 import sys
 import tempfile
 from datetime import datetime
 from pathlib import Path
+from scripts.concat_shuffle.concat_shuffle import run as concat_shuffle
+from scripts.make_shuffle_clips.make_shuffle_clips import (
+    MAX_CLIP,
+    MIN_CLIP,
+    TARGET_SEC,
+    _parse_duration,
+)
+from scripts.make_shuffle_clips.make_shuffle_clips import run as make_shuffle_clips
 from utils import cleanup, setup_logging
 
 ROOT_DESK = Path.home() / "Desktop"
@@ -23,55 +36,83 @@ def timestamp(fmt: str) -> str:
     return datetime.now().strftime(fmt)
 
 
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--tmp-dir",
+        type=Path,
+        help="scratch directory (default: a fresh /tmp/shuffle_*)",
+    )
+    ap.add_argument("--target-sec", type=_parse_duration, default=TARGET_SEC)
+    ap.add_argument("--min-clip", type=_parse_duration, default=MIN_CLIP)
+    ap.add_argument("--max-clip", type=_parse_duration, default=MAX_CLIP)
+    ap.add_argument("--seed", type=int)
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of clips extracted concurrently (default 1)",
+    )
+    ap.add_argument(
+        "--engine",
+        choices=("clip", "source"),
+        default="clip",
+        help="one ffmpeg per clip, or one per source file cutting all its clips",
+    )
+    ap.add_argument(
+        "--direct",
+        action="store_true",
+        help="concat straight from the sources (no scratch clips)",
+    )
+    ap.add_argument(
+        "--resume",
+        action="store_true",
+        help="reuse the plan saved in --tmp-dir and cut only missing clips",
+    )
+    ap.add_argument("files", nargs="*")
+    return ap.parse_args(argv)
+
+
 def main() -> None:
-    if len(sys.argv) < 2:
+    ns = parse_args()
+    if not ns.files:
         sys.exit("❌  No input files")
+    if ns.resume and ns.tmp_dir is None:
+        sys.exit("❌  --resume needs the --tmp-dir of the interrupted run")
 
     LOG_DIR.mkdir(parents=True, exist_ok=True)
     log = LOG_DIR / f"Montage-Shuffle-{timestamp('%Y%m%dT%H%M%S')}.log"
     log.touch()
 
-    tmp_dir = Path(tempfile.mkdtemp(prefix="shuffle_", dir="/tmp"))
-    clip_list = tmp_dir / "clip_list.txt"
+    if ns.tmp_dir is None:
+        tmp_dir = Path(tempfile.mkdtemp(prefix="shuffle_", dir="/tmp"))
+    else:
+        tmp_dir = ns.tmp_dir
+        tmp_dir.mkdir(parents=True, exist_ok=True)
     out_file = ROOT_DESK / f"montage_{timestamp('%Y%m%d_%H%M%S')}.mkv"
 
-    env = os.environ.copy()
-    env["PATH"] = f"{PATH_ENV}:{env['PATH']}"
-
-    scripts_root = Path(__file__).resolve().parents[1]
-
-    def run(cmd: list[str]) -> None:
-        subprocess.run(cmd, env=env, check=True)
+    os.environ["PATH"] = f"{PATH_ENV}:{os.environ['PATH']}"
+    logger = setup_logging(str(log), "shuffle")
 
     # -- extract -------------------------------------------------------------
-    run(
-        [
-            sys.executable,
-            str(scripts_root / "make_shuffle_clips" / "make_shuffle_clips.py"),
-            "--logfile",
-            str(log),
-            "--tmp-dir",
-            str(tmp_dir),
-            *sys.argv[1:],
-        ]
+    clip_list = make_shuffle_clips(
+        ns.files,
+        tmp_dir,
+        logger=logger,
+        target_sec=ns.target_sec,
+        min_clip=ns.min_clip,
+        max_clip=ns.max_clip,
+        seed=ns.seed,
+        jobs=ns.jobs,
+        engine=ns.engine,
+        direct=ns.direct,
+        resume=ns.resume,
     )
 
     # -- concat --------------------------------------------------------------
-    run(
-        [
-            sys.executable,
-            str(scripts_root / "concat_shuffle" / "concat_shuffle.py"),
-            "--logfile",
-            str(log),
-            "--clip-list",
-            str(clip_list),
-            "--out-file",
-            str(out_file),
-        ]
-    )
+    concat_shuffle(clip_list, out_file, logger=logger)
 
     # -- clean ---------------------------------------------------------------
-    logger = setup_logging(str(log), "cleanup")
     cleanup(tmp_dir, logger)
 
     print(f"\n🎉  Shuffle montage ready:\n{out_file}")
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import logging
+import sys
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+import pytest
+
+from scripts.make_shuffle_clips.make_shuffle_clips import MAX_CLIP
+from scripts.run_shuffle_pipeline import run_shuffle_pipeline as pipeline
+
+
+def test_parse_args_accepts_extraction_options() -> None:
+    ns = pipeline.parse_args(
+        ["--seed", "3", "--target-sec", "2m", "--min-clip", "1", "a.mp4", "b.mp4"]
+    )
+    assert ns.seed == 3
+    assert ns.target_sec == 120
+    assert ns.min_clip == 1
+    assert ns.max_clip == MAX_CLIP
+    assert ns.files == ["a.mp4", "b.mp4"]
+
+
+def test_options_reach_make_shuffle_clips(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    seen: dict[str, Any] = {}
+
+    def fake_extract(files: list[str], tmp_dir: Path, **kwargs: Any) -> Path:
+        seen.update(kwargs, files=files, tmp_dir=tmp_dir)
+        return tmp_dir / "clip_list.txt"
+
+    monkeypatch.setattr(pipeline, "ROOT_DESK", tmp_path)
+    monkeypatch.setattr(pipeline, "LOG_DIR", tmp_path)
+    monkeypatch.setattr(pipeline, "make_shuffle_clips", fake_extract)
+    monkeypatch.setattr(pipeline, "concat_shuffle", lambda *a, **k: None)
+    logger = logging.getLogger("test-shuffle-pipeline")
+    monkeypatch.setattr(pipeline, "setup_logging", lambda *a: logger)
+    scratch = tmp_path / "scratch"
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "run_shuffle_pipeline.py",
+            "--seed", "3",
+            "--target-sec", "60",
+            "--max-clip", "4",
+            "--jobs", "2",
+            "--engine", "source",
+            "--tmp-dir", str(scratch),
+            "--resume",
+            "a.mp4",
+        ],
+    )  # fmt: skip
+    pipeline.main()
+    assert seen["files"] == ["a.mp4"]
+    assert seen["tmp_dir"] == scratch
+    assert (seen["seed"], seen["target_sec"], seen["max_clip"]) == (3, 60, 4)
+    assert (seen["jobs"], seen["engine"], seen["resume"]) == (2, "source", True)
+    assert not scratch.exists()
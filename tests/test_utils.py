@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from utils import MetadataCache, probe_concurrently
+
+
+def test_metadata_cache_compacts_on_load(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    kept, gone = tmp_path / "kept.mp4", tmp_path / "gone.mp4"
+    kept.write_text("a")
+    gone.write_text("b")
+    cache = MetadataCache("test")
+    cache.put(kept, {"duration": 1.0})
+    cache.put(kept, {"complexity": 900})  # appends the merged record again
+    cache.put(gone, {"duration": 2.0})
+    assert len(cache.path.read_text().splitlines()) == 3
+    gone.unlink()
+
+    fresh = MetadataCache("test")
+    assert fresh.get(kept) == {"duration": 1.0, "complexity": 900}
+    assert len(fresh.path.read_text().splitlines()) == 1
+
+    kept.write_text("edited")  # the old record no longer applies
+    assert MetadataCache("test").get(kept) is None
+    assert MetadataCache("test").path.read_text() == ""
+
+
+def test_probe_concurrently_keeps_input_order() -> None:
+    paths = [Path(f"clip{i}.mp4") for i in range(6)]
+    finished: list[Path] = []
+
+    def probe(path: Path) -> str:
+        time.sleep(0.05 * (len(paths) - int(path.stem[4:])))  # later ones first
+        finished.append(path)
+        return path.stem
+
+    assert probe_concurrently(probe, paths, jobs=len(paths)) == [p.stem for p in paths]
+    assert finished != paths  # the probes really did finish out of order
@@ -1,11 +1,22 @@
 from __future__ import annotations
 
 import atexit
+import bisect
+import itertools
+import json
 import logging
+import os
+import re
+import subprocess
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import shutil
+from typing import Any, Callable, MutableMapping, Sequence, TypeVar
+
+T = TypeVar("T")
 
 
 def setup_logging(logfile: str, name: str | None = None) -> logging.Logger:
@@ -42,6 +53,130 @@ def setup_logging(logfile: str, name: str | None = None) -> logging.Logger:
     return logger
 
 
+class TaggedLogger(logging.LoggerAdapter[logging.Logger]):
+    """Prefix every message with ``[tag]`` so interleaved jobs sharing one
+    log stay attributable."""
+
+    def __init__(self, logger: logging.Logger, tag: str) -> None:
+        super().__init__(logger, {})
+        self.tag = tag
+
+    def process(
+        self, msg: Any, kwargs: MutableMapping[str, Any]
+    ) -> tuple[Any, MutableMapping[str, Any]]:
+        return f"[{self.tag}] {msg}", kwargs
+
+
+# what stage ``run`` functions log to: the script's logger or a tagged view
+StageLogger = logging.Logger | TaggedLogger
+
+
+def atomic_write_text(path: str | Path, text: str) -> None:
+    """Write ``text`` to a sibling temp file and rename it over ``path``."""
+    tgt = Path(path)
+    tmp = tgt.with_name(f".{tgt.name}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, tgt)
+
+
+def graft_point(disc_path: str, src: str | Path) -> str:
+    """
+    One ``-graft-points`` entry (``/on/disc=/source``) with backslashes and
+    ``=`` escaped as genisoimage expects.
+    """
+
+    def esc(part: str) -> str:
+        return part.replace("\\", "\\\\").replace("=", "\\=")
+
+    return f"{esc(disc_path)}={esc(str(src))}"
+
+
+def read_graft_points(path: str | Path) -> list[tuple[str, Path]]:
+    """
+    Parse a manifest of ``/on/disc=/source`` lines (the genisoimage
+    ``-path-list`` format) into ``(disc path, source)`` pairs.  Blank lines
+    and ``#`` comments are skipped; a line without ``=`` maps the source to
+    its own name in the disc root.
+    """
+    entries: list[tuple[str, Path]] = []
+    for raw in Path(path).read_text(encoding="utf-8").splitlines():
+        if not raw.strip() or raw.lstrip().startswith("#"):
+            continue
+        parts: list[str] = []
+        cur, i = "", 0
+        while i < len(raw):
+            ch = raw[i]
+            if ch == "\\" and i + 1 < len(raw):
+                cur += raw[i + 1]
+                i += 2
+                continue
+            if ch == "=" and not parts:
+                parts.append(cur)
+                cur = ""
+            else:
+                cur += ch
+            i += 1
+        if parts:
+            entries.append((parts[0], Path(cur)))
+        else:
+            entries.append((f"/{Path(cur).name}", Path(cur)))
+    return entries
+
+
+# ffmpeg pads some values (``speed= 1.5x``, ``bitrate= 812.3kbits/s``)
+PROGRESS_RE = re.compile(r"^[a-z_0-9]+=\s*\S*$")
+
+
+class FFmpegProgress:
+    """
+    Incremental parser for ``ffmpeg -progress`` output.
+
+    Feed it lines one by one; each ``key=value`` line is collected and the
+    finished block is returned when its closing ``progress=…`` line arrives.
+    """
+
+    def __init__(self) -> None:
+        self._block: dict[str, str] = {}
+
+    @staticmethod
+    def matches(line: str) -> bool:
+        return bool(PROGRESS_RE.match(line))
+
+    def feed(self, line: str) -> dict[str, str] | None:
+        if not self.matches(line):
+            return None
+        key, _, value = line.partition("=")
+        self._block[key] = value.strip()
+        if key != "progress":
+            return None
+        block, self._block = self._block, {}
+        return block
+
+
+def run_streamed(cmd: Sequence[str], on_line: Callable[[str], None]) -> int:
+    """
+    Run ``cmd`` with stdout and stderr merged into one pipe and hand every
+    line to ``on_line`` as it arrives; return the exit status.  Nothing is
+    accumulated here, so memory stays flat however chatty the process is.
+    """
+    with subprocess.Popen(
+        list(cmd),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors="replace",
+        bufsize=1,
+    ) as proc:
+        assert proc.stdout is not None
+        try:
+            for line in proc.stdout:
+                on_line(line.rstrip("\r\n"))
+        except BaseException:
+            proc.kill()
+            raise
+    return proc.returncode
+
+
 def cleanup(build_dir: str | Path, logger: logging.Logger) -> None:
     """Delete temporary working directory if it exists."""
     tgt = Path(build_dir)
@@ -50,3 +185,269 @@ def cleanup(build_dir: str | Path, logger: logging.Logger) -> None:
         logger.info(f"Removed {tgt}")
     else:
         logger.warning(f"Nothing to delete: {tgt}")
+
+
+class Timeline:
+    """
+    Media files laid end to end on one global clock.
+
+    Backed by the sorted array of file start times, so mapping a global
+    timestamp to ``(file index, local offset)`` is a bisect, not a scan.
+    """
+
+    def __init__(self, durations: Sequence[float]) -> None:
+        self.starts = list(itertools.accumulate(durations, initial=0.0))
+
+    def __len__(self) -> int:
+        return len(self.starts) - 1
+
+    @property
+    def total(self) -> float:
+        return self.starts[-1]
+
+    def duration(self, idx: int) -> float:
+        return self.starts[idx + 1] - self.starts[idx]
+
+    def locate(self, t: float) -> tuple[int, float]:
+        """Return ``(file index, local offset)`` of global time ``t``."""
+        if not 0.0 <= t < self.total:
+            raise ValueError(f"{t:.3f}s lies outside the {self.total:.3f}s timeline")
+        # bisect_right steps over zero‑length files sharing the same start
+        idx = bisect.bisect_right(self.starts, t) - 1
+        return idx, t - self.starts[idx]
+
+    def spans(self, t: float, length: float) -> list[tuple[int, float, float]]:
+        """
+        Split ``[t, t + length)`` into per‑file ``(index, local start, length)``
+        pieces; a window running past the end of the timeline is cut short.
+        """
+        idx, local = self.locate(t)
+        pieces = []
+        while length > 1e-9 and idx < len(self):
+            piece = min(length, self.duration(idx) - local)
+            if piece > 1e-9:
+                pieces.append((idx, local, piece))
+            length -= piece
+            idx, local = idx + 1, 0.0
+        return pieces
+
+
+def cache_dir() -> Path:
+    """Directory for on‑disk caches shared by all scripts."""
+    base = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(base) / "everyday-scripts"
+
+
+class MetadataCache:
+    """
+    Append‑only JSON‑lines cache of per‑file metadata.
+
+    Records are keyed on (resolved path, st_size, st_mtime_ns), so an edited
+    or replaced file simply misses.  The whole file is read once on first use;
+    new records are appended.  When that read finds superseded lines or
+    records of files that changed or disappeared, the file is rewritten
+    with only the live records, so it never grows beyond one line per file.
+    Every failure is swallowed – a broken cache only costs the probe it
+    would have saved.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._entries: dict[str, dict[str, Any]] | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        return cache_dir() / f"{self.name}.jsonl"
+
+    @staticmethod
+    def _key(path: Path) -> str | None:
+        try:
+            resolved = Path(path).resolve()
+            st = resolved.stat()
+        except OSError:
+            return None
+        return json.dumps([str(resolved), st.st_size, st.st_mtime_ns])
+
+    @staticmethod
+    def _is_live(key: str) -> bool:
+        try:
+            path, size, mtime_ns = json.loads(key)
+            st = os.stat(path)
+        except (OSError, ValueError, TypeError):
+            return False
+        return bool(st.st_size == size and st.st_mtime_ns == mtime_ns)
+
+    def _load(self) -> dict[str, dict[str, Any]]:
+        if self._entries is None:
+            entries: dict[str, dict[str, Any]] = {}
+            lines = 0
+            try:
+                with self.path.open(encoding="utf-8") as fh:
+                    for line in fh:
+                        lines += 1
+                        try:
+                            rec = json.loads(line)
+                            entries[rec["key"]] = rec["data"]
+                        except (ValueError, KeyError, TypeError):
+                            continue  # torn or foreign line
+            except OSError:
+                pass
+            self._entries = {k: v for k, v in entries.items() if self._is_live(k)}
+            if lines > len(self._entries):
+                try:
+                    atomic_write_text(
+                        self.path,
+                        "".join(
+                            json.dumps({"key": k, "data": v}) + "\n"
+                            for k, v in self._entries.items()
+                        ),
+                    )
+                except OSError:
+                    pass
+        return self._entries
+
+    def get(self, path: Path) -> dict[str, Any] | None:
+        key = self._key(path)
+        if key is None:
+            return None
+        with self._lock:
+            return self._load().get(key)
+
+    def put(self, path: Path, data: dict[str, Any]) -> dict[str, Any]:
+        """Merge ``data`` into the record for ``path`` and return the result."""
+        key = self._key(path)
+        if key is None:
+            return data
+        with self._lock:
+            entries = self._load()
+            merged = {**entries.get(key, {}), **data}
+            entries[key] = merged
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with self.path.open("a", encoding="utf-8") as fh:
+                    fh.write(json.dumps({"key": key, "data": merged}) + "\n")
+            except OSError:
+                pass
+        return merged
+
+
+probe_cache = MetadataCache("probe")
+
+
+def probe_media(path: Path) -> dict[str, Any]:
+    """
+    Return ``{"duration": s, "start": s, "streams": [{"type", "codec", "channels"}, …]}``.
+
+    ``start`` is the container start time: ``-ss`` offsets count from it,
+    packet timestamps do not.  Served from :data:`probe_cache` when the file
+    is unchanged, otherwise ffprobe runs once and the result is stored.
+    """
+    cached = probe_cache.get(path)
+    if cached is not None and "duration" in cached:
+        return cached
+    out = subprocess.check_output(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-show_entries",
+            "format=duration,start_time:stream=codec_type,codec_name,channels",
+            "-of",
+            "json",
+            str(path),
+        ],
+        text=True,
+    )
+    info = json.loads(out)
+    return probe_cache.put(
+        path,
+        {
+            "duration": float(info["format"]["duration"]),
+            "start": float(info["format"].get("start_time", 0.0)),
+            "streams": [
+                {
+                    "type": st.get("codec_type"),
+                    "codec": st.get("codec_name"),
+                    "channels": st.get("channels"),
+                }
+                for st in info.get("streams", [])
+            ],
+        },
+    )
+
+
+def probe_duration(path: Path) -> float:
+    """Container duration of ``path`` in seconds (cached)."""
+    return float(probe_media(path)["duration"])
+
+
+def probe_start(path: Path) -> float:
+    """Container start time of ``path`` in seconds (cached)."""
+    return float(probe_media(path)["start"])
+
+
+PROBE_JOBS = min(8, os.cpu_count() or 1)  # ffprobe is latency‑, not CPU‑bound
+
+
+def probe_concurrently(
+    probe: Callable[[Path], T], paths: Sequence[Path], jobs: int = PROBE_JOBS
+) -> list[T]:
+    """Run ``probe`` over many files concurrently; results keep input order."""
+    if jobs <= 1 or len(paths) <= 1:
+        return [probe(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(probe, paths))
+
+
+def probe_durations(paths: Sequence[Path], jobs: int = PROBE_JOBS) -> list[float]:
+    """Probe many files concurrently; durations come back in input order."""
+    return probe_concurrently(probe_duration, paths, jobs)
+
+
+KEYFRAME_SPAN = 10.0  # seconds indexed either side of a seek point; > any GOP
+
+
+def probe_keyframes(
+    path: Path, points: Sequence[float], span: float = KEYFRAME_SPAN
+) -> list[float]:
+    """
+    Key‑frame times of the first video stream within ``span`` seconds of
+    ``points``, relative to the container start.
+
+    Only those windows are demuxed (``-read_intervals``), so a seek costs a
+    few packets instead of a pass over the whole file.  Packet timestamps
+    are absolute – an MPEG‑TS segment may start at hours – while ``-ss`` and
+    ``points`` count from :func:`probe_start`, so the windows and the result
+    are shifted between the two bases.
+    """
+    if not points:
+        return []
+    origin = probe_start(path)
+    intervals = ",".join(
+        f"{origin + max(0.0, p - span):.6f}%{origin + p + span:.6f}"
+        for p in sorted(points)
+    )
+    out = subprocess.check_output(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-select_streams",
+            "v:0",
+            "-read_intervals",
+            intervals,
+            "-show_entries",
+            "packet=pts_time,flags",
+            "-of",
+            "csv=p=0",
+            str(path),
+        ],
+        text=True,
+    )
+    keyframes = set()  # neighbouring windows may overlap
+    for line in out.splitlines():
+        pts, _, flags = line.partition(",")
+        if flags.startswith("K") and pts not in ("", "N/A"):
+            keyframes.add(float(pts) - origin)
+    return sorted(keyframes)